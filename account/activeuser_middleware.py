@@ -1,19 +1,23 @@
 import datetime
-from django.core.cache import cache
 from django.conf import settings
-from rest_framework.authtoken.models import Token
 
-from .services.user_services import get_user_by_request
+from .authentication import get_token_key, resolve_token_user
+from .services import presence
 from django.utils.deprecation import MiddlewareMixin
 
 
 class ActiveUserMiddleware(MiddlewareMixin):
     def process_request(self, request):
-        try:
-            current_user = get_user_by_request(request)
-        except Token.DoesNotExist:
-            return
+        key = get_token_key(request)
+        current_user = resolve_token_user(request, key) if key else None
         if current_user:
-            now = datetime.datetime.now()
-            cache.set('seen_%s' % current_user.tg_id, now,
-                      settings.USER_LASTSEEN_TIMEOUT)
+            update_last_seen(current_user)
+
+
+def update_last_seen(user):
+    """The last seen time is written at most once per USER_LASTSEEN_UPDATE_INTERVAL"""
+    now = datetime.datetime.now()
+    last_seen = user.last_seen()
+    if last_seen and now - last_seen < datetime.timedelta(seconds=settings.USER_LASTSEEN_UPDATE_INTERVAL):
+        return
+    presence.touch(user.pk, now.timestamp())
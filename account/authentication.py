@@ -0,0 +1,112 @@
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import router, transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
+from rest_framework.authtoken.models import Token
+
+TOKEN_CACHE_KEY = 'auth_token_%s'
+USER_CACHE_KEY = 'auth_user_%s'
+USER_VERSION_KEY = 'auth_user_version_%s'
+# the fields the authentication and the permissions need, the rest are loaded on demand, see get_full_user
+CACHED_USER_FIELDS = ('id', 'is_active', 'is_staff')
+
+
+def get_token_key(request):
+    """The key from the "Authorization: Token <key>" header, None if there is no valid one"""
+    auth = get_authorization_header(request).split()
+    if len(auth) != 2 or auth[0].lower() != b'token':
+        return None
+    try:
+        return auth[1].decode()
+    except UnicodeError:
+        return None
+
+
+def get_token_user(key):
+    """
+    The user of the token, None if the token doesn't exist. The token → user id mapping and the user
+    are cached separately, so a user change invalidates one key whatever tokens the user has.
+    """
+    user_id = cache.get(TOKEN_CACHE_KEY % key)
+    if user_id is None:
+        user_id = Token.objects.filter(key=key).values_list('user_id', flat=True).first()
+        if user_id is None:
+            return None
+        cache.set(TOKEN_CACHE_KEY % key, user_id, settings.AUTH_TOKEN_CACHE_TIMEOUT)
+    return get_cached_user(user_id)
+
+
+def get_cached_user(user_id):
+    """
+    The CACHED_USER_FIELDS of the user are cached with the version of its data. The version is read before
+    the user, so a user read before a change is cached with the old version and never returned after the change,
+    see invalidate_user. The other fields (the password hash among them) are not cached.
+    """
+    version_key = USER_VERSION_KEY % user_id
+    cached = cache.get_many([version_key, USER_CACHE_KEY % user_id])
+    version = cached.get(version_key)
+    if version is None:
+        cache.add(version_key, uuid.uuid4().hex, settings.AUTH_TOKEN_CACHE_TIMEOUT)
+        version = cache.get(version_key)
+    entry = cached.get(USER_CACHE_KEY % user_id)
+    if entry is not None and entry[0] == version:
+        return _build_user(entry[1])
+
+    values = get_user_model().objects.filter(pk=user_id).values(*CACHED_USER_FIELDS).first()
+    if values is None:
+        return None
+    cache.set(USER_CACHE_KEY % user_id, (version, values), settings.AUTH_TOKEN_CACHE_TIMEOUT)
+    return _build_user(values)
+
+
+def _build_user(values):
+    """A user with the other fields deferred, like the one loaded by .only(*CACHED_USER_FIELDS)"""
+    user_model = get_user_model()
+    field_names = [f.attname for f in user_model._meta.concrete_fields if f.attname in values]
+    return user_model.from_db(router.db_for_read(user_model), field_names, [values[x] for x in field_names])
+
+
+def get_full_user(user):
+    """The user with all the fields loaded by one query, the users of CachedTokenAuthentication have only a few"""
+    if not user.get_deferred_fields():
+        return user
+    return get_user_model().objects.get(pk=user.pk)
+
+
+def resolve_token_user(request, key):
+    """get_token_user() once per request, ActiveUserMiddleware and the DRF authentication share the result"""
+    resolved = getattr(request, '_token_user', None)
+    if resolved is None or resolved[0] != key:
+        resolved = request._token_user = (key, get_token_user(key))
+    return resolved[1]
+
+
+def invalidate_token(key):
+    cache.delete(TOKEN_CACHE_KEY % key)
+
+
+def invalidate_user(user_id):
+    """A new version makes the cached user stale. It's set after commit, the user can't be read in the old state then"""
+    transaction.on_commit(lambda: cache.set(USER_VERSION_KEY % user_id, uuid.uuid4().hex,
+                                            settings.AUTH_TOKEN_CACHE_TIMEOUT))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication with the users cached by their tokens, see get_token_user"""
+
+    def authenticate(self, request):
+        self.django_request = request._request
+        return super().authenticate(request)
+
+    def authenticate_credentials(self, key):
+        user = resolve_token_user(self.django_request, key)
+        if user is None:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        return user, key
@@ -0,0 +1,49 @@
+# Generated by Django 4.0.1 on 2026-10-18 11:19
+
+import common.storage
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0019_remove_user_is_block_alter_user_gifts'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='user',
+            options={'verbose_name': 'Пользователь', 'verbose_name_plural': 'Пользователи'},
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='avatar',
+            field=models.ImageField(default='images/uploads/users/avatars/default.png', storage=common.storage.ContentAddressedStorage(), upload_to='images/uploads/users/photo/', verbose_name='Аватарка'),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='date_joined',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата регистрации'),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='first_name',
+            field=models.CharField(blank=True, max_length=150, verbose_name='Имя'),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='is_active',
+            field=models.BooleanField(default=True, help_text='Пользователь не сможет зайти, если будет забанен', verbose_name='Статус незабанненого'),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='is_staff',
+            field=models.BooleanField(default=False, help_text='Даёт право блокировать пользователей', verbose_name='Статус модератора'),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='last_name',
+            field=models.CharField(blank=True, max_length=150, verbose_name='Фамилия'),
+        ),
+    ]
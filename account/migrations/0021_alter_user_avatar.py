@@ -0,0 +1,19 @@
+# Generated by Django 4.0.1 on 2026-10-18 11:38
+
+import common.storage
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0020_alter_user_options_alter_user_avatar_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='avatar',
+            field=common.storage.ContentImageField(default='images/uploads/users/avatars/default.png', storage=common.storage.ContentAddressedStorage(), upload_to='images/uploads/users/photo/', verbose_name='Аватарка'),
+        ),
+    ]
@@ -1,12 +1,16 @@
 from django.db import models
+from django.db.models import signals
+from django.dispatch import receiver
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.core.validators import MinValueValidator
-from django.core.cache import cache
 from django.conf import settings
 from datetime import datetime, timedelta
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+from common.services.files import release_files, update_references
+from common.storage import ContentImageField, content_storage, pop_stored_name
+
 
 class Ability(models.Model):
     name = models.CharField(max_length=20)
@@ -49,11 +53,15 @@ class UserManager(BaseUserManager):
         return self._create_user(tg_id, password, **extra_fields)
 
 
+DEFAULT_AVATAR = "images/uploads/users/avatars/default.png"
+
+
 class User(AbstractUser):
     username = None
 
     gifts = models.IntegerField(verbose_name="Дары", default=0, validators=[MinValueValidator(settings.MIN_GIFTS_VALUE)])
-    avatar = models.ImageField(verbose_name="Аватарка", upload_to="images/uploads/users/photo/", default="images/uploads/users/avatars/default.png")
+    avatar = ContentImageField(verbose_name="Аватарка", upload_to="images/uploads/users/photo/", default=DEFAULT_AVATAR,
+                               storage=content_storage)
     description = models.TextField(max_length=1200, default="Пользователь не написал о себе.")
     abilities = models.ManyToManyField(Ability, max_length=10, blank=True)
     city = models.CharField(verbose_name="Город проживания", max_length=100, blank=True)
@@ -88,15 +96,63 @@ class User(AbstractUser):
     objects = UserManager()
 
     def last_seen(self):
-        return cache.get('seen_%s' % self.tg_id)
+        from .services import presence
+        return presence.get_last_seen(self.pk)
 
     def is_online(self) -> bool:
-        if self.last_seen():
-            now = datetime.now()
-            return now < self.last_seen() + timedelta(seconds=settings.USER_ONLINE_TIMEOUT)
+        """For many users use presence.get_online_ids()"""
+        last_seen = self.last_seen()
+        if last_seen:
+            return datetime.now() < last_seen + timedelta(seconds=settings.USER_ONLINE_TIMEOUT)
         return False
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # the avatar as it is in the database, see user_avatar_saved
+        avatar = instance.__dict__.get('avatar')  # a str until the field is read
+        instance._loaded_avatar_name = getattr(avatar, 'name', avatar)
+        return instance
+
     class Meta:
         verbose_name = 'Пользователь'
         verbose_name_plural = 'Пользователи'
 
+
+
+@receiver(signals.post_save, sender=User, dispatch_uid='user_auth_cache_saved')
+@receiver(signals.post_delete, sender=User, dispatch_uid='user_auth_cache_deleted')
+def user_changed(sender, instance, **kwargs):
+    """A cached user is dropped on any change, e.g. a ban, see account.authentication"""
+    from .authentication import invalidate_user
+    invalidate_user(instance.pk)
+
+
+@receiver(signals.post_save, sender='authtoken.Token', dispatch_uid='token_auth_cache_saved')
+@receiver(signals.post_delete, sender='authtoken.Token', dispatch_uid='token_auth_cache_deleted')
+def token_changed(sender, instance, **kwargs):
+    from .authentication import invalidate_token
+    invalidate_token(instance.key)
+
+
+@receiver(signals.post_save, sender=User, dispatch_uid='user_avatar_saved')
+def user_avatar_saved(sender, instance, created, update_fields=None, **kwargs):
+    """Counts the references to the avatar files, see ContentAddressedStorage"""
+    if update_fields is not None and 'avatar' not in update_fields:
+        return
+    loaded_name = getattr(instance, '_loaded_avatar_name', None)
+    if not created and loaded_name is None:  # the avatar was not loaded, it can't be changed
+        return
+    name = instance.avatar.name
+    stored_name = pop_stored_name(instance, 'avatar')
+    if created or name != loaded_name or stored_name:
+        # the default avatar is not counted
+        update_references(instance.avatar.storage, name if name != DEFAULT_AVATAR else None,
+                          loaded_name if not created and loaded_name != DEFAULT_AVATAR else None, stored_name)
+    instance._loaded_avatar_name = name
+
+
+@receiver(signals.post_delete, sender=User, dispatch_uid='user_avatar_deleted')
+def user_avatar_deleted(sender, instance, **kwargs):
+    if instance.avatar and instance.avatar.name != DEFAULT_AVATAR:
+        release_files(instance.avatar.storage, [instance.avatar.name])
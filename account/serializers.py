@@ -1,7 +1,10 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from rest_framework.authtoken.models import Token
-from django.core.cache import cache
+from django.db import models
+
+from .services import presence
+from .services.registration import LOGIN, REGISTER, use_confirm_code
 
 
 User = get_user_model()
@@ -22,7 +25,7 @@ class UserPasswordChangeSerializer(serializers.Serializer):
 
     def validate(self, data):
         """add here additional check for password strength if needed"""
-        if not self.context.get('request').user.check_password(data.get("old_password")):
+        if not self.instance.check_password(data.get("old_password")):
             raise serializers.ValidationError({'old_password': 'Wrong password.'})
         return data
 
@@ -96,17 +99,41 @@ class BlockUserSerializer(serializers.Serializer):
         return instance
 
 
+class PresenceListSerializer(serializers.ListSerializer):
+    """Looks up the presence of the users of all the items at once, the child serializer defines `get_user_id`"""
+
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, models.Manager) else data)
+        self.context['online_user_ids'] = presence.get_online_ids({self.child.get_user_id(x) for x in items})
+        return super().to_representation(items)
+
+
+def is_online_in_context(serializer, user_id):
+    """The presence looked up by PresenceListSerializer, or a lookup of one user"""
+    online_user_ids = serializer.context.get('online_user_ids')
+    if online_user_ids is None:
+        online_user_ids = presence.get_online_ids([user_id])
+    return user_id in online_user_ids
+
+
 class UserInfoSerializer(serializers.ModelSerializer):
     is_current_user = serializers.SerializerMethodField("is_current_session_user")
     is_online = serializers.SerializerMethodField("is_user_online")
     is_current_user_moderator = serializers.SerializerMethodField("is_current_user_staff")
+    abilities = serializers.SlugRelatedField(slug_field="name", many=True, read_only=True)
 
     class Meta:
         model = User
-        fields = ("avatar", "description", "is_current_user", "is_online", "first_name", "is_current_user_moderator")
+        fields = ("id", "avatar", "description", "is_current_user", "is_online", "first_name",
+                  "is_current_user_moderator", "abilities")
+        list_serializer_class = PresenceListSerializer
+
+    @staticmethod
+    def get_user_id(obj):
+        return obj.pk
 
     def is_user_online(self, obj):
-        return obj.is_online()
+        return is_online_in_context(self, obj.pk)
 
     def is_current_user_staff(self, obj):
         user = self.context.get("request").user
@@ -138,12 +165,11 @@ class RegisterUserSerializer(serializers.Serializer):
         code = data.get('code')
         if not code:
             raise serializers.ValidationError({'code': 'Код не указан!'})
-        tg_id = cache.get(f'register_code_{code}')
+        tg_id = use_confirm_code(REGISTER, code)
 
         if not tg_id:
             raise serializers.ValidationError({'code': 'Код неверный'})
 
-        cache.delete(f'register_code_{code}')
         return {
             "tg_id": tg_id
         }
@@ -158,13 +184,11 @@ class LoginSerializer(serializers.Serializer):
         if not code:
             raise serializers.ValidationError({'code': 'Код не указан!'})
 
-        tg_id = cache.get(f'login_code_{code}')
-        if not tg_id:
+        tg_id = use_confirm_code(LOGIN, code)
+        user = User.objects.filter(tg_id=tg_id).first() if tg_id else None
+        if not user:
             raise serializers.ValidationError({'code': 'Код неверный'})
 
-        cache.delete(f'login_tg_{tg_id}')
-        cache.delete(f'login_code_{code}')
-        user = User.objects.get(tg_id=tg_id)
         if not user.is_active:
             raise serializers.ValidationError(
                 {'code': 'Пользователь был заблокирован по причине: ' + user.block_reason}
@@ -0,0 +1,91 @@
+"""
+Presence of the users: the last seen time of every user is a member of one sorted set scored by the time,
+so the presence of many users is looked up with one round-trip and the online users are counted by a range.
+A Redis cache keeps the set natively, other caches keep a {user_id: timestamp} dict under the same key.
+The dict is updated by read-modify-write, which is atomic only within one process (see _dict_lock),
+so the fallback is meant for the local-memory cache of development and tests: with a shared cache
+concurrent touches of several processes lose each other's updates. Use Redis in production.
+"""
+import datetime
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+PRESENCE_KEY = 'presence'
+# serializes the read-modify-write of the dict fallback between the threads of a process
+_dict_lock = threading.Lock()
+
+
+def _redis():
+    """The Redis client of the default cache, None if the cache is not django-redis"""
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection('default')
+    except (ImportError, NotImplementedError):
+        return None
+
+
+def _online_since():
+    return time.time() - settings.USER_ONLINE_TIMEOUT
+
+
+def _stale_before():
+    return time.time() - settings.USER_LASTSEEN_TIMEOUT
+
+
+def touch(user_id, timestamp=None):
+    """Marks the user as seen now, the users not seen for USER_LASTSEEN_TIMEOUT are trimmed on the way"""
+    timestamp = timestamp or time.time()
+    client = _redis()
+    if client is not None:
+        key = cache.make_key(PRESENCE_KEY)
+        pipeline = client.pipeline(transaction=False)
+        pipeline.zadd(key, {str(user_id): timestamp})
+        pipeline.zremrangebyscore(key, '-inf', _stale_before())
+        pipeline.expire(key, settings.USER_LASTSEEN_TIMEOUT)
+        pipeline.execute()
+        return
+    stale_before = _stale_before()
+    with _dict_lock:
+        members = {k: v for k, v in cache.get(PRESENCE_KEY, {}).items() if v >= stale_before}
+        members[user_id] = timestamp
+        cache.set(PRESENCE_KEY, members, settings.USER_LASTSEEN_TIMEOUT)
+
+
+def get_last_seen_many(user_ids) -> dict:
+    """{user_id: last seen datetime} of the given users which were seen, one round-trip"""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return {}
+    client = _redis()
+    if client is not None:
+        pipeline = client.pipeline(transaction=False)
+        key = cache.make_key(PRESENCE_KEY)
+        for user_id in user_ids:
+            pipeline.zscore(key, str(user_id))
+        scores = dict(zip(user_ids, pipeline.execute()))
+    else:
+        members = cache.get(PRESENCE_KEY, {})
+        scores = {x: members.get(x) for x in user_ids}
+    stale_before = _stale_before()
+    return {k: datetime.datetime.fromtimestamp(v) for k, v in scores.items() if v is not None and v >= stale_before}
+
+
+def get_last_seen(user_id):
+    return get_last_seen_many([user_id]).get(user_id)
+
+
+def get_online_ids(user_ids) -> set:
+    """Ids of the online users among the given ones"""
+    online_since = datetime.datetime.fromtimestamp(_online_since())
+    return {k for k, v in get_last_seen_many(user_ids).items() if v > online_since}
+
+
+def online_count() -> int:
+    client = _redis()
+    if client is not None:
+        return client.zcount(cache.make_key(PRESENCE_KEY), _online_since(), '+inf')
+    online_since = _online_since()
+    return sum(1 for x in cache.get(PRESENCE_KEY, {}).values() if x > online_since)
@@ -1,13 +1,53 @@
 from account.models import User
 from account.exceptions import UserAlreadyExist
+from django.conf import settings
+from django.core.cache import cache
 from rest_framework.authtoken.models import Token
 from django.utils.crypto import get_random_string
 
+REGISTER = 'register'
+LOGIN = 'login'
+CODE_KEY = '{purpose}_code_{code}'
+CHAT_KEY = '{purpose}_tg_{tg_id}'
+MAX_CODE_ATTEMPTS = 10
+
 
 def generate_confirm_code():
     return get_random_string(length=5, allowed_chars='1234567890')
 
 
+def is_registered(tg_id) -> bool:
+    return User.objects.filter(tg_id=str(tg_id)).exists()
+
+
+def issue_confirm_code(purpose: str, tg_id) -> str:
+    """
+    The pending code of the chat or a new one. A new code is reserved with cache.add,
+    so a code in use is never given to another chat.
+    """
+    chat_key = CHAT_KEY.format(purpose=purpose, tg_id=tg_id)
+    code = cache.get(chat_key)
+    if code:
+        return code
+    for _ in range(MAX_CODE_ATTEMPTS):
+        code = generate_confirm_code()
+        if cache.add(CODE_KEY.format(purpose=purpose, code=code), tg_id, settings.USER_CONFIRM_TG_TIMEOUT):
+            cache.set(chat_key, code, settings.USER_CONFIRM_TG_TIMEOUT)
+            return code
+    raise RuntimeError("No free confirm code")
+
+
+def use_confirm_code(purpose: str, code: str):
+    """The tg_id the code was issued for, None if the code is wrong. A code can be used once"""
+    code_key = CODE_KEY.format(purpose=purpose, code=code)
+    tg_id = cache.get(code_key)
+    # only one of concurrent requests with the same code deletes it
+    if not tg_id or not cache.delete(code_key):
+        return None
+    cache.delete(CHAT_KEY.format(purpose=purpose, tg_id=tg_id))
+    return tg_id
+
+
 def create_user(username: str, email: str, password: str,) -> str:
     user, created = User.objects.get_or_create(username=username,
                                                email=email)
@@ -1,3 +1,173 @@
-from django.test import TestCase
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from trade.models import Good
+from .authentication import CACHED_USER_FIELDS, USER_CACHE_KEY, get_token_user
+from .models import Ability, User, user_changed
+from .services import presence, registration
+from .views import UsersInfoAPIView
+
+
+class CachedTokenAuthenticationTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(tg_id='1')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def count_queries(self, url='/api/profile'):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        return response, len(queries)
+
+    def test_cached_user(self):
+        first, first_queries = self.count_queries()
+        self.assertEqual(first.status_code, 200)
+        second, second_queries = self.count_queries()
+        self.assertEqual(second.status_code, 200)
+        # the token and the user are resolved once for the middleware and the view, then read from the cache
+        self.assertEqual(first_queries - second_queries, 2)
+
+    def test_cached_fields(self):
+        self.count_queries()
+        self.assertEqual(cache.get(USER_CACHE_KEY % self.user.pk)[1],
+                         {'id': self.user.pk, 'is_active': True, 'is_staff': False})
+        user = get_token_user(self.token.key)
+        self.assertEqual(user, self.user)
+        self.assertIn('password', user.get_deferred_fields())
+
+        response = self.client.post('/api/settings', {'first_name': 'Иван', 'city': 'Москва', 'district': 'Центр',
+                                                      'phone_number': '+7'})
+        self.assertEqual(response.status_code, 200)
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual((user.first_name, user.tg_id, user.password), ('Иван', '1', self.user.password))
+
+    def test_ban(self):
+        self.count_queries()
+        moderator = User.objects.create(tg_id='2', is_staff=True)
+        self.client.force_authenticate(moderator)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put('/api/user/ban', {'pk': self.user.pk, 'reason': 'Спам'})
+        # force_authenticate(None) drops the credentials as well
+        self.client.force_authenticate(None)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        response, _ = self.count_queries()
+        self.assertEqual(response.status_code, 401)
+
+    def test_ban_during_miss(self):
+        users = User.objects.filter(pk=self.user.pk)
+
+        def ban_after_read():
+            user = users.values(*CACHED_USER_FIELDS).first()
+            with self.captureOnCommitCallbacks(execute=True):
+                users.update(is_active=False)
+                user_changed(User, User.objects.get(pk=self.user.pk))
+            return user
+
+        # the user is read before the ban is committed and cached after it
+        with mock.patch.object(User.objects, 'filter',
+                               return_value=mock.Mock(values=mock.Mock(return_value=mock.Mock(first=ban_after_read)))):
+            self.assertTrue(get_token_user(self.token.key).is_active)
+        self.assertFalse(get_token_user(self.token.key).is_active)
+
+    def test_token_rotation(self):
+        self.count_queries()
+        Token.objects.filter(user=self.user).delete()
+        response, _ = self.count_queries()
+        self.assertEqual(response.status_code, 401)
+
+    def test_last_seen(self):
+        self.count_queries()
+        last_seen = self.user.last_seen()
+        self.assertIsNotNone(last_seen)
+        self.count_queries()
+        self.assertEqual(self.user.last_seen(), last_seen)
+
+
+class PresenceTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_online(self):
+        now = time.time()
+        presence.touch(1, now)
+        presence.touch(2, now - settings.USER_ONLINE_TIMEOUT - 1)
+        presence.touch(3, now - settings.USER_LASTSEEN_TIMEOUT - 1)
+
+        self.assertEqual(presence.get_online_ids([1, 2, 3, 4]), {1})
+        self.assertEqual(set(presence.get_last_seen_many([1, 2, 3, 4])), {1, 2})
+        self.assertEqual(presence.online_count(), 1)
+
+    def test_concurrent_touches(self):
+        with ThreadPoolExecutor(8) as executor:
+            list(executor.map(presence.touch, range(1, 101)))
+        self.assertEqual(set(presence.get_last_seen_many(range(1, 101))), set(range(1, 101)))
+
+    def test_feed_authors(self):
+        users = [User.objects.create(tg_id=str(i)) for i in range(2)]
+        for user in users:
+            Good.objects.create(name='Товар', user=user, contacts='-', state=Good.PublishState.PUBLISHED)
+        presence.touch(users[0].pk)
+
+        self.client.force_authenticate(User.objects.create(tg_id='viewer'))
+        response = self.client.get('/api/trade/feed/')
+        online = {x['user']: x['author_online'] for x in response.data['results']}
+        self.assertEqual(online, {users[0].pk: True, users[1].pk: False})
+        self.assertEqual(self.client.get('/api/users/online').data, {'count': 1})
+
+
+class UsersInfoTest(APITestCase):
+    def test_batch(self):
+        abilities = [Ability.objects.create(name=f'Умение {i}') for i in range(2)]
+        users = [User.objects.create(tg_id=str(i)) for i in range(20)]
+        for user in users:
+            user.abilities.set(abilities)
+        ids = ','.join(str(x.pk) for x in users)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/users', {'ids': ids})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 2)
+        self.assertEqual([x['id'] for x in response.data['users']], [x.pk for x in users])
+        self.assertEqual(response.data['users'][0]['abilities'], ['Умение 0', 'Умение 1'])
+        self.assertIn('max-age', response['Cache-Control'])
+
+    def test_limit(self):
+        ids = ','.join(map(str, range(1, UsersInfoAPIView.MAX_IDS + 2)))
+        self.assertEqual(self.client.get('/api/users', {'ids': ids}).status_code, 400)
+        self.assertEqual(self.client.get('/api/users', {'ids': 'a,b'}).status_code, 400)
+
+
+class ConfirmCodeTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_register_and_login(self):
+        code = registration.issue_confirm_code(registration.REGISTER, 100)
+        self.assertEqual(registration.issue_confirm_code(registration.REGISTER, 100), code)
+        self.assertNotEqual(registration.issue_confirm_code(registration.REGISTER, 101), code)
+
+        response = self.client.post('/api/register', {'code': code})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(registration.is_registered(100))
+        # a code is used once
+        self.assertEqual(self.client.post('/api/register', {'code': code}).status_code, 400)
+
+        code = registration.issue_confirm_code(registration.LOGIN, 100)
+        response = self.client.post('/api/login', {'code': code})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['token'])
+        self.assertNotEqual(registration.issue_confirm_code(registration.LOGIN, 100), code)
+
+    def test_collisions(self):
+        with mock.patch.object(registration, 'generate_confirm_code', side_effect=['11111', '11111', '22222']):
+            self.assertEqual(registration.issue_confirm_code(registration.LOGIN, 1), '11111')
+            self.assertEqual(registration.issue_confirm_code(registration.LOGIN, 2), '22222')
@@ -1,6 +1,7 @@
 from django.urls import path
 from .views import RegisterAPIView, UserInfoAPIView, ProfileAPIView, LoginAPIView, SettingsAPIView, \
-    APIChangePasswordView, UploadAvatarAPIView, BlockUserAPIView
+    APIChangePasswordView, UploadAvatarAPIView, BlockUserAPIView, OnlineCountAPIView, \
+    UsersInfoAPIView
 
 
 urlpatterns = [
@@ -10,6 +11,8 @@ urlpatterns = [
     path("password/change", APIChangePasswordView.as_view()),
     path("settings", SettingsAPIView.as_view()),
     path("user/<int:pk>", UserInfoAPIView.as_view()),
+    path("users", UsersInfoAPIView.as_view()),
     path("image/upload", UploadAvatarAPIView.as_view()),
-    path("user/ban", BlockUserAPIView.as_view())
+    path("user/ban", BlockUserAPIView.as_view()),
+    path("users/online", OnlineCountAPIView.as_view()),
 ]
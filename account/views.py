@@ -1,4 +1,5 @@
 from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_cache_control
 from rest_framework.exceptions import ValidationError
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -8,6 +9,8 @@ from .serializers import (RegisterUserSerializer, UserChangeAvatarSerializer, Lo
                           UserSettingsSerializer, ProfileSerializer, UserPasswordChangeSerializer, UserInfoSerializer, \
                           BlockUserSerializer)
 from django.contrib.auth import get_user_model
+from .authentication import get_full_user
+from .services import presence
 
 
 User = get_user_model()
@@ -36,7 +39,7 @@ class UploadAvatarAPIView(generics.UpdateAPIView):
     serializer_class = UserChangeAvatarSerializer
 
     def get_object(self, queryset=None):
-        return self.request.user
+        return get_full_user(self.request.user)
 
 
 class APIChangePasswordView(generics.UpdateAPIView):
@@ -45,7 +48,7 @@ class APIChangePasswordView(generics.UpdateAPIView):
     permission_classes = (IsAuthenticated,)
 
     def get_object(self, queryset=None):
-        return self.request.user
+        return get_full_user(self.request.user)
 
 
 class SettingsAPIView(generics.UpdateAPIView):
@@ -56,14 +59,14 @@ class SettingsAPIView(generics.UpdateAPIView):
     serializer_class = UserSettingsSerializer
 
     def post(self, request) -> Response:
-        user = request.user
+        user = get_full_user(request.user)
         serializer = self.serializer_class(data=request.data, context={"request": request}, instance=user)
         serializer.is_valid(raise_exception=True)
         self.perform_update(serializer)
         return Response({"status": "ok"})
 
     def get(self, request) -> Response:
-        serializer = self.serializer_class(request.user, context={"request": request})
+        serializer = self.serializer_class(get_full_user(request.user), context={"request": request})
         return Response(serializer.data) # TODO: test it, we removed status200
 
 
@@ -87,7 +90,7 @@ class ProfileAPIView(APIView):
     serializer_class = ProfileSerializer
 
     def get(self, request):
-        user = request.user
+        user = get_full_user(request.user)
         serializer = self.serializer_class(user, context={"request": request})
         return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -98,7 +101,7 @@ class UserInfoAPIView(APIView):
     serializer_class = UserInfoSerializer
 
     def get(self, request, pk):
-        user = get_object_or_404(User, pk=pk)
+        user = get_object_or_404(User.objects.prefetch_related("abilities"), pk=pk)
 
         serializer = self.serializer_class(user, context={
             "request": request
@@ -106,6 +109,41 @@ class UserInfoAPIView(APIView):
         return Response(serializer.data)
 
 
+class UsersInfoAPIView(APIView):
+    """Возвращает информацию о нескольких юзерах: /api/users?ids=1,2,3"""
+    permission_classes = (AllowAny,)
+    serializer_class = UserInfoSerializer
+    MAX_IDS = 100
+    MAX_AGE = 30  # seconds, the online status goes stale after that
+
+    def get(self, request):
+        try:
+            ids = {int(x) for x in request.query_params.get("ids", "").split(",") if x.strip()}
+        except ValueError:
+            raise ValidationError({"ids": "Укажите id через запятую"})
+        if not ids:
+            raise ValidationError({"ids": "Список id пуст"})
+        if len(ids) > self.MAX_IDS:
+            raise ValidationError({"ids": f"Не больше {self.MAX_IDS} id"})
+
+        users = User.objects.filter(pk__in=ids).prefetch_related("abilities").order_by("pk")
+        serializer = self.serializer_class(users, many=True, context={
+            "request": request
+        })
+        response = Response({"users": serializer.data})
+        # the data depends on the current user, see UserInfoSerializer
+        patch_cache_control(response, private=True, max_age=self.MAX_AGE)
+        return response
+
+
+class OnlineCountAPIView(APIView):
+    """Возвращает количество пользователей онлайн."""
+    permission_classes = (AllowAny,)
+
+    def get(self, request):
+        return Response({"count": presence.online_count()})
+
+
 class RegisterAPIView(APIView):
     """Регстрирует пользователя"""
     permission_classes = (AllowAny,)
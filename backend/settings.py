@@ -55,10 +55,12 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     'account',
     'trade',
     'common',
+    'tgbot',
 
     'rest_framework',
     'rest_framework.authtoken',
@@ -89,6 +91,39 @@ CACHES = {
 USER_ONLINE_TIMEOUT = 180   # 3 mi
 USER_LASTSEEN_TIMEOUT = 5 * 60 * 60  # 5 min
 USER_CONFIRM_TG_TIMEOUT = 60 * 5  # 5 mi
+USER_LASTSEEN_UPDATE_INTERVAL = 60  # seconds, the last seen time of a user is written at most once per interval
+AUTH_TOKEN_CACHE_TIMEOUT = 60 * 60  # 1 hour, the cached users are invalidated on any change anyway
+TELEGRAM_API_URL = env.str('TELEGRAM_API_URL', 'https://api.telegram.org')  # a local fake Bot API can be used for benchmarks
+TELEGRAM_SENDER_WORKERS = 8
+TELEGRAM_SENDER_MAX_RETRIES = 3
+TELEGRAM_SENDER_TIMEOUT = 10  # seconds
+TELEGRAM_GLOBAL_RATE_LIMIT = 30  # messages per second for the bot
+TELEGRAM_CHAT_RATE_LIMIT = 1  # messages per second for a chat
+TELEGRAM_OUTBOX_BATCH_SIZE = 100
+TELEGRAM_OUTBOX_MAX_ATTEMPTS = 5
+TELEGRAM_OUTBOX_RETRY_DELAY = 30  # seconds, doubled after every failed attempt
+TELEGRAM_OUTBOX_POLL_INTERVAL = 1  # seconds
+# seconds, the claimed messages are not given to other workers while the batch is sent, must exceed the batch sending time
+TELEGRAM_OUTBOX_LEASE_TIMEOUT = 10 * 60
+# the bot gets updates by the webhook if the secret is set (see set_telegram_webhook), run_polling.py otherwise
+TELEGRAM_WEBHOOK_SECRET = env.str('TELEGRAM_WEBHOOK_SECRET', '')
+TELEGRAM_WEBHOOK_MAX_CONNECTIONS = 40
+TELEGRAM_UPDATE_DEDUPE_TIMEOUT = 24 * 60 * 60  # 1 day, Telegram keeps undelivered updates for 24 hours
+TELEGRAM_BOT_WORKERS = env.int('TELEGRAM_BOT_WORKERS', 8)  # threads handling the bot updates, one chat is handled in order
+ORPHAN_IMAGES_GRACE_PERIOD = 24 * 60 * 60  # 1 day, images not attached to a good are deleted after it
+FILE_DELETION_WORKERS = 8  # threads deleting files in batches
+IMAGE_UPLOAD_MAX_BYTES = 20 * 1024 * 1024  # 20 MB
+IMAGE_UPLOAD_MAX_PIXELS = 50 * 1000 * 1000  # 50 Mp, checked by the image header before decoding
+IMAGE_VARIANT_WIDTHS = (320, 640, 1280)  # px, resized copies of the uploaded images, see process_images
+IMAGE_VARIANT_QUALITY = 80
+IMAGE_PROCESSING_WORKERS = env.int('IMAGE_PROCESSING_WORKERS', 2)  # processes
+IMAGE_PROCESSING_BATCH_SIZE = 20
+IMAGE_PROCESSING_POLL_INTERVAL = 5  # seconds
+CATEGORIES_TREE_CACHE_TIMEOUT = 24 * 60 * 60  # 1 day, the snapshot is invalidated on any category change anyway
+# seconds, goods sent to moderation are collected and moderators get one digest per interval, 0 notifies at once
+MODERATION_DIGEST_INTERVAL = env.int('MODERATION_DIGEST_INTERVAL', 0)
+MODERATION_DIGEST_MAX_GOODS = 50  # goods in one digest message, Telegram messages are limited to 4096 characters
+MODERATORS_CACHE_TIMEOUT = 5 * 60  # 5 min
 
 ROOT_URLCONF = 'backend.urls'
 
@@ -124,7 +159,7 @@ DATABASES = {
 REST_FRAMEWORK = {
     'NON_FIELD_ERRORS_KEY': 'error',
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'account.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
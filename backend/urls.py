@@ -8,6 +8,7 @@ urlpatterns = [
     path('common/', include('common.urls')),
     path('api/', include('account.urls')),
     path('api/trade/', include('trade.urls')),
+    path('tgbot/', include('tgbot.urls')),
 ]
 
 admin.site.site_header = "Общество взаимообмена"
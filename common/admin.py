@@ -1,3 +1,16 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import StoredFile, TelegramOutboxMessage
+
+
+@admin.register(TelegramOutboxMessage)
+class TelegramOutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ("id", "receiver_id", "attempts", "next_attempt_at", "is_failed", "created_at")
+    list_filter = ("is_failed", )
+    search_fields = ("receiver_id", )
+
+
+@admin.register(StoredFile)
+class StoredFileAdmin(admin.ModelAdmin):
+    list_display = ("id", "name", "references", "created_at")
+    search_fields = ("name", )
@@ -0,0 +1,79 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from common.services.telegram_sender import TelegramSender
+
+
+class FakeBotAPIHandler(BaseHTTPRequestHandler):
+    """Answers sendMessage like the Bot API, every `flood_every`-th request gets a 429"""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(self.server.latency)
+        with self.server.lock:
+            self.server.requests += 1
+            flood = self.server.flood_every and self.server.requests % self.server.flood_every == 0
+
+        if flood:
+            status, data = 429, {'ok': False, 'error_code': 429, 'description': 'Too Many Requests: retry after 1',
+                                 'parameters': {'retry_after': 1}}
+        else:
+            status, data = 200, {'ok': True, 'result': {'message_id': self.server.requests}}
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fake_bot_api(latency=0.0, flood_every=0) -> ThreadingHTTPServer:
+    """Starts FakeBotAPIHandler in a thread, its URL is http://127.0.0.1:<server.server_port>"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeBotAPIHandler)
+    server.latency = latency
+    server.flood_every = flood_every
+    server.requests = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class Command(BaseCommand):
+    help = "Measures the Telegram sender throughput against a Bot API, a local fake one by default"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=300)
+        parser.add_argument('--chats', type=int, default=100, help="Messages are spread over this number of chats")
+        parser.add_argument('--api-url', help="A running Bot API server, the local fake one is started if omitted")
+        parser.add_argument('--latency', type=float, default=0.05, help="Response delay of the fake server, seconds")
+        parser.add_argument('--flood-every', type=int, default=0, help="The fake server answers 429 to every N-th request")
+        parser.add_argument('--workers', type=int, default=settings.TELEGRAM_SENDER_WORKERS)
+        parser.add_argument('--global-rate', type=float, default=settings.TELEGRAM_GLOBAL_RATE_LIMIT)
+        parser.add_argument('--chat-rate', type=float, default=settings.TELEGRAM_CHAT_RATE_LIMIT)
+
+    def handle(self, *args, **options):
+        server = None
+        api_url = options['api_url']
+        if not api_url:
+            server = start_fake_bot_api(options['latency'], options['flood_every'])
+            api_url = f'http://127.0.0.1:{server.server_port}'
+
+        sender = TelegramSender(token='bench', api_url=api_url, max_workers=options['workers'],
+                                global_rate=options['global_rate'], chat_rate=options['chat_rate'])
+        messages = [(str(i % options['chats'] + 1), f'Message {i}', {}) for i in range(options['messages'])]
+        try:
+            report = sender.send_many(messages)
+        finally:
+            if server:
+                server.shutdown()
+
+        self.stdout.write(f"sent: {report.sent}, failed: {report.failed}, elapsed: {report.elapsed:.2f}s, "
+                          f"throughput: {report.throughput:.1f} msg/s")
@@ -0,0 +1,24 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from common.services.telegram import send_outbox_batch
+
+
+class Command(BaseCommand):
+    help = "Sends the queued Telegram messages. Runs forever unless --once is given"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Send all the due messages and exit")
+        parser.add_argument('--batch-size', type=int, default=settings.TELEGRAM_OUTBOX_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        while True:
+            processed = send_outbox_batch(options['batch_size'])
+            if processed:
+                self.stdout.write(f"Processed {processed} messages")
+                continue
+            if options['once']:
+                return
+            time.sleep(settings.TELEGRAM_OUTBOX_POLL_INTERVAL)
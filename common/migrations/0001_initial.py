@@ -0,0 +1,37 @@
+# Generated by Django 4.0.1 on 2026-10-18 11:03
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TelegramOutboxMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('receiver_id', models.CharField(max_length=20, verbose_name='id телеграм получателя')),
+                ('message', models.TextField(verbose_name='Сообщение')),
+                ('options', models.JSONField(blank=True, default=dict, verbose_name='Параметры отправки')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Попытки отправки')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Следующая попытка')),
+                ('is_failed', models.BooleanField(default=False, verbose_name='Не удалось отправить')),
+                ('last_error', models.TextField(blank=True, verbose_name='Последняя ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Исходящее сообщение телеграм',
+                'verbose_name_plural': 'Исходящие сообщения телеграм',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='telegramoutboxmessage',
+            index=models.Index(condition=models.Q(('is_failed', False)), fields=['next_attempt_at', 'id'], name='tg_outbox_pending_idx'),
+        ),
+    ]
@@ -1,3 +1,42 @@
 from django.db import models
+from django.utils import timezone
 
-# Create your models here.
+
+class TelegramOutboxMessage(models.Model):
+    """
+    A Telegram message waiting to be sent. Messages are written in the transaction of the change
+    they notify about and are sent by the `send_telegram_outbox` worker.
+    """
+    receiver_id = models.CharField("id телеграм получателя", max_length=20)
+    message = models.TextField("Сообщение")
+    options = models.JSONField("Параметры отправки", default=dict, blank=True)
+    attempts = models.PositiveSmallIntegerField("Попытки отправки", default=0)
+    next_attempt_at = models.DateTimeField("Следующая попытка", default=timezone.now)
+    is_failed = models.BooleanField("Не удалось отправить", default=False)
+    last_error = models.TextField("Последняя ошибка", blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Исходящее сообщение телеграм'
+        verbose_name_plural = 'Исходящие сообщения телеграм'
+        indexes = [
+            models.Index(fields=['next_attempt_at', 'id'], name='tg_outbox_pending_idx',
+                         condition=models.Q(is_failed=False)),
+        ]
+
+    def __str__(self):
+        return f"id{self.id} -> {self.receiver_id}"
+
+
+class StoredFile(models.Model):
+    """A file of ContentAddressedStorage and the number of rows referencing it, see common.services.files"""
+    name = models.CharField("Имя файла", max_length=255, unique=True)
+    references = models.PositiveIntegerField("Количество ссылок", default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Сохранённый файл'
+        verbose_name_plural = 'Сохранённые файлы'
+
+    def __str__(self):
+        return f"{self.name} ({self.references})"
@@ -0,0 +1,140 @@
+import itertools
+import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from common.models import StoredFile
+
+
+class FileDeletionBatch:
+    """Files to delete, the errors are logged"""
+
+    def __init__(self, storage, names):
+        self.storage = storage
+        self.names = list(names)
+
+    def __call__(self):
+        for name in self.names:
+            try:
+                self.storage.delete(name)
+            except OSError:
+                logging.getLogger(__name__).exception(f"Can't delete file {name}")
+
+
+class FileReleaseBatch(FileDeletionBatch):
+    """
+    Files released in a transaction, their references are dropped by one on_commit callback
+    and the files left without references are deleted
+    """
+
+    def __call__(self):
+        with transaction.atomic():
+            # deleted under the locks of the StoredFile rows, see ContentAddressedStorage._save
+            FileDeletionBatch(self.storage, drop_references(self.names) + take_unreferenced_files(self.names))()
+
+
+def _by_count(names):
+    """Groups the distinct names by the number of their occurrences, {count: [name, ...]}"""
+    counts = Counter(x for x in names if x)
+    return {count: [x[0] for x in group]
+            for count, group in itertools.groupby(sorted(counts.items(), key=lambda x: x[1]), key=lambda x: x[1])}
+
+
+def acquire_files(names):
+    """Counts a reference to each of the files of ContentAddressedStorage"""
+    groups = _by_count(names)
+    if not groups:
+        return
+    StoredFile.objects.bulk_create([StoredFile(name=x) for group in groups.values() for x in group],
+                                   ignore_conflicts=True)
+    for count, group in groups.items():
+        StoredFile.objects.filter(name__in=group).update(references=F('references') + count)
+
+
+def drop_references(names) -> list:
+    """
+    Drops a reference to each of the files. Returns the files not tracked by StoredFile
+    (stored before the content addressing), they are not shared and can be deleted.
+    """
+    groups = _by_count(names)
+    if not groups:
+        return []
+    all_names = [x for group in groups.values() for x in group]
+    tracked = set(StoredFile.objects.filter(name__in=all_names).values_list('name', flat=True))
+    for count, group in groups.items():
+        StoredFile.objects.filter(name__in=group).update(references=Greatest(F('references') - count, 0))
+    return [x for x in all_names if x not in tracked]
+
+
+def take_unreferenced_files(names) -> list:
+    """
+    Deletes StoredFile of the files left without references and returns their names, run it in a transaction
+    and delete the files before commit: the rows stay locked, so nobody can take a new reference meanwhile.
+    After a rollback a StoredFile may have no file, ContentAddressedStorage writes it again then.
+    """
+    unreferenced = list(StoredFile.objects.select_for_update()
+                        .filter(name__in=set(names), references=0).values_list('name', flat=True))
+    StoredFile.objects.filter(name__in=unreferenced).delete()
+    return unreferenced
+
+
+def update_references(storage, name, old_name=None, stored_name=None):
+    """
+    Counts a reference to the new file of a row and releases the old one, None is no file.
+    The file saved to ContentAddressedStorage by the row already has a reference, see pop_stored_name.
+    """
+    acquired = [name] if name and name != old_name else []
+    released = [old_name] if old_name and old_name != name else []
+    if stored_name in acquired:
+        acquired.remove(stored_name)
+    elif stored_name:
+        released.append(stored_name)
+    acquire_files(acquired)
+    release_files(storage, released)
+
+
+def release_files(storage, names):
+    """
+    Drops a reference to each of the files after commit, the files released in one transaction are processed
+    together by a few queries, see FileReleaseBatch. The files left without references are deleted,
+    the untracked files are deleted as well. A rollback keeps the references.
+    """
+    names = [x for x in names if x]
+    if not names:
+        return
+
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        return FileReleaseBatch(storage, names)()
+
+    # reuse the batch registered in the same savepoint, a rollback to that savepoint discards it as a whole
+    savepoint_ids = set(connection.savepoint_ids)
+    for entry in connection.run_on_commit:
+        sids, func = entry[0], entry[1]
+        if type(func) is FileReleaseBatch and func.storage is storage and sids == savepoint_ids:
+            func.names.extend(names)
+            return
+
+    transaction.on_commit(FileReleaseBatch(storage, names))
+
+
+def delete_files(storage, names, workers=None) -> int:
+    """Deletes the files right now in a thread pool, returns the number of the freed bytes"""
+    def delete(name):
+        try:
+            size = storage.size(name)
+            storage.delete(name)
+            return size
+        except FileNotFoundError:
+            return 0
+        except OSError:
+            logging.getLogger(__name__).exception(f"Can't delete file {name}")
+            return 0
+
+    with ThreadPoolExecutor(max_workers=workers or settings.FILE_DELETION_WORKERS) as executor:
+        return sum(executor.map(delete, names))
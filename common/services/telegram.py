@@ -1,11 +1,20 @@
+import datetime
 import logging
 
 import telebot
 from django.conf import settings
+from django.db import transaction
 from django.db.models import QuerySet
+from django.utils import timezone
+
+from common.models import TelegramOutboxMessage
+from .telegram_sender import get_sender
 
 bot = telebot.TeleBot(settings.INFO_BOT_TOKEN)
 
+# the chat doesn't exist or the user has blocked the bot, there is no sense to retry
+PERMANENT_ERROR_CODES = (400, 403)
+
 
 def send_message(receiver_id: str, message: str, **kwargs):
     try:
@@ -17,6 +26,66 @@ def send_message(receiver_id: str, message: str, **kwargs):
 
 def multiple_send_msg(recipients_list, message, **kwargs):
     if isinstance(recipients_list, QuerySet):
-        recipients_list = [x.tg_id for x in recipients_list]
-    for recipient in recipients_list:
-        send_message(recipient, message, **kwargs)
+        recipients_list = recipients_list.values_list('tg_id', flat=True)
+    report = get_sender().send_many([(x, message, kwargs) for x in recipients_list])
+    for result in report.results:
+        if not result.ok:
+            logging.getLogger(__name__).error(f"\nreceiver_id={result.receiver_id}\nerror={result.error}")
+    return report
+
+
+def enqueue_messages(messages, **kwargs):
+    """Queues (receiver_id, message) pairs with one insert"""
+    TelegramOutboxMessage.objects.bulk_create([
+        TelegramOutboxMessage(receiver_id=str(receiver_id), message=message, options=kwargs)
+        for receiver_id, message in messages if receiver_id
+    ])
+
+
+def send_outbox_batch(batch_size=None) -> int:
+    """
+    Sends a batch of due messages from the outbox. Sent messages are deleted, the others are retried later.
+    The batch is claimed in a short transaction with SKIP LOCKED by moving next_attempt_at forward
+    for TELEGRAM_OUTBOX_LEASE_TIMEOUT, so several workers can drain the outbox together
+    and no lock is held while the messages are sent. Returns the number of processed messages.
+    """
+    messages = _claim_batch(batch_size or settings.TELEGRAM_OUTBOX_BATCH_SIZE)
+    report = get_sender().send_many([(x.receiver_id, x.message, x.options) for x in messages])
+    sent_ids, not_sent = [], []
+    for message, result in zip(messages, report.results):
+        if result.ok:
+            sent_ids.append(message.id)
+        else:
+            _schedule_retry(message, result.error, result.error_code, result.retry_after)
+            not_sent.append(message)
+
+    with transaction.atomic():
+        TelegramOutboxMessage.objects.filter(pk__in=sent_ids).delete()
+        TelegramOutboxMessage.objects.bulk_update(not_sent, ['attempts', 'next_attempt_at', 'is_failed', 'last_error'])
+    return len(messages)
+
+
+@transaction.atomic
+def _claim_batch(batch_size) -> list:
+    """Due messages leased to the caller, a worker died while sending gives them back when the lease expires"""
+    now = timezone.now()
+    messages = list(
+        TelegramOutboxMessage.objects
+        .select_for_update(skip_locked=True)
+        .filter(is_failed=False, next_attempt_at__lte=now)
+        .order_by('next_attempt_at', 'id')[:batch_size]
+    )
+    lease_until = now + datetime.timedelta(seconds=settings.TELEGRAM_OUTBOX_LEASE_TIMEOUT)
+    TelegramOutboxMessage.objects.filter(pk__in=[x.id for x in messages]).update(next_attempt_at=lease_until)
+    return messages
+
+
+def _schedule_retry(message, error, error_code=None, retry_after=None):
+    message.attempts += 1
+    message.last_error = error
+    if error_code in PERMANENT_ERROR_CODES or message.attempts >= settings.TELEGRAM_OUTBOX_MAX_ATTEMPTS:
+        message.is_failed = True
+        logging.getLogger(__name__).error(f"Telegram message id{message.id} is not sent: {error}")
+        return
+    delay = retry_after or settings.TELEGRAM_OUTBOX_RETRY_DELAY * 2 ** (message.attempts - 1)
+    message.next_attempt_at = timezone.now() + datetime.timedelta(seconds=delay)
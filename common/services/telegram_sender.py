@@ -0,0 +1,177 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. A token may be reserved in advance: the balance goes negative
+    and the caller sleeps until the reserved token is refilled, so waiting callers are served in order.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """Takes a token and returns how many seconds to wait before it can be used"""
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+    def acquire(self):
+        time.sleep(self.reserve())
+
+    def pause(self, seconds: float):
+        """
+        Nothing is given out for the next `seconds`, e.g. after a 429 with retry_after.
+        Pauses don't add up, several threads hitting the same limit at once pause the bucket once.
+        """
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, -seconds * self.rate)
+
+    def is_idle(self) -> bool:
+        with self.lock:
+            self._refill(time.monotonic())
+            return self.tokens >= self.capacity
+
+
+class SendResult(NamedTuple):
+    receiver_id: str
+    ok: bool
+    error_code: Optional[int] = None
+    error: str = ''
+    retry_after: Optional[int] = None
+
+
+class SendReport(NamedTuple):
+    results: list
+    elapsed: float
+
+    @property
+    def sent(self) -> int:
+        return sum(1 for x in self.results if x.ok)
+
+    @property
+    def failed(self) -> int:
+        return len(self.results) - self.sent
+
+    @property
+    def throughput(self) -> float:
+        """Sent messages per second"""
+        return self.sent / self.elapsed if self.elapsed else 0.0
+
+
+class TelegramSender:
+    """
+    Sends messages through the Bot API with a pooled HTTP session and a bounded number of threads.
+    Follows the Telegram limits with token buckets: a global one and one per chat.
+    A 429 response pauses both the chat and the whole bot for `retry_after` seconds, as flood waits
+    are often bot-wide, and the message is retried.
+    """
+    MAX_CHAT_BUCKETS = 10000
+
+    def __init__(self, token=None, api_url=None, max_workers=None, global_rate=None, chat_rate=None,
+                 max_retries=None, timeout=None):
+        self.token = token if token is not None else settings.INFO_BOT_TOKEN
+        self.api_url = (api_url or settings.TELEGRAM_API_URL).rstrip('/')
+        self.max_workers = max_workers or settings.TELEGRAM_SENDER_WORKERS
+        self.chat_rate = chat_rate or settings.TELEGRAM_CHAT_RATE_LIMIT
+        self.max_retries = max_retries if max_retries is not None else settings.TELEGRAM_SENDER_MAX_RETRIES
+        self.timeout = timeout or settings.TELEGRAM_SENDER_TIMEOUT
+        self.global_bucket = TokenBucket(global_rate or settings.TELEGRAM_GLOBAL_RATE_LIMIT)
+        self.chat_buckets = {}
+        self.chat_buckets_lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _chat_bucket(self, receiver_id) -> TokenBucket:
+        with self.chat_buckets_lock:
+            bucket = self.chat_buckets.get(receiver_id)
+            if bucket is None:
+                if len(self.chat_buckets) >= self.MAX_CHAT_BUCKETS:
+                    self.chat_buckets = {k: v for k, v in self.chat_buckets.items() if not v.is_idle()}
+                bucket = self.chat_buckets[receiver_id] = TokenBucket(self.chat_rate)
+            return bucket
+
+    def send(self, receiver_id, message: str, **options) -> SendResult:
+        receiver_id = str(receiver_id)
+        chat_bucket = self._chat_bucket(receiver_id)
+        result = None
+        for attempt in range(self.max_retries + 1):
+            chat_bucket.acquire()
+            self.global_bucket.acquire()
+            result = self._post(receiver_id, message, options)
+            if result.ok:
+                return result
+            if result.error_code == 429:
+                chat_bucket.pause(result.retry_after or 1)
+                self.global_bucket.pause(result.retry_after or 1)
+            elif result.error_code is not None and result.error_code < 500:
+                return result  # the request is wrong, a retry doesn't help
+            else:
+                time.sleep(min(2 ** attempt, 30))
+        return result
+
+    def _post(self, receiver_id, message, options) -> SendResult:
+        try:
+            response = self.session.post(
+                f'{self.api_url}/bot{self.token}/sendMessage',
+                json={'chat_id': receiver_id, 'text': message, **options},
+                timeout=self.timeout,
+            )
+            data = response.json()
+        except (requests.RequestException, ValueError) as e:
+            return SendResult(receiver_id, False, error=str(e))
+        if data.get('ok'):
+            return SendResult(receiver_id, True)
+        return SendResult(
+            receiver_id, False,
+            error_code=data.get('error_code', response.status_code),
+            error=data.get('description', ''),
+            retry_after=data.get('parameters', {}).get('retry_after'),
+        )
+
+    def send_many(self, messages) -> SendReport:
+        """Sends (receiver_id, message, options) tuples concurrently, the results keep the order of the messages"""
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(executor.map(lambda x: self.send(x[0], x[1], **x[2]), messages))
+        report = SendReport(results, time.monotonic() - started)
+        if results:
+            logger.info(f"Telegram: sent {report.sent}, failed {report.failed}, "
+                        f"{report.throughput:.1f} msg/s in {report.elapsed:.2f}s")
+        return report
+
+
+_sender = None
+_sender_lock = threading.Lock()
+
+
+def get_sender() -> TelegramSender:
+    """The process-wide sender, so the HTTP connections and the rate limits are shared"""
+    global _sender
+    with _sender_lock:
+        if _sender is None:
+            _sender = TelegramSender()
+        return _sender
@@ -0,0 +1,67 @@
+import hashlib
+import os
+
+from django.core.files.storage import FileSystemStorage
+from django.db import models, transaction
+from django.db.models.fields.files import ImageFieldFile
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores a file under the SHA-256 of its content, e.g. content/ab/cd/abcd...ef.jpg,
+    only the extension is taken from the name given by upload_to. Identical files are stored once,
+    the rows referencing a file are counted by StoredFile, see common.services.files.
+    A saved file gets a reference at once, use ContentImageField so the row doesn't count it again.
+    """
+    directory = 'content'
+
+    def _save(self, name, content):
+        from .services.files import acquire_files
+
+        # ImageUploadHandler hashes the file while receiving it
+        digest = getattr(content, 'sha256', None) or self.hash(content)
+        name = self.content_name(digest, name)
+        # the reference is counted under the lock of the StoredFile row, so the file can't be deleted
+        # between the check and the counting: the unreferenced files are deleted under the same lock
+        with transaction.atomic():
+            acquire_files([name])
+            if not self.exists(name):
+                return super()._save(name, content)
+        return name
+
+    def content_name(self, digest, name):
+        extension = os.path.splitext(name)[1].lower()
+        return f'{self.directory}/{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+    @staticmethod
+    def hash(content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        return digest.hexdigest()
+
+
+content_storage = ContentAddressedStorage()
+
+
+class ContentImageFieldFile(ImageFieldFile):
+    def save(self, name, content, save=True):
+        super().save(name, content, save=False)
+        # the storage has counted a reference to the file, see pop_stored_name
+        stored_names = self.instance.__dict__.setdefault('_stored_file_names', {})
+        stored_names[self.field.attname] = self.name
+        if save:
+            self.instance.save()
+
+
+class ContentImageField(models.ImageField):
+    """An ImageField of ContentAddressedStorage, it remembers the files saved to the storage by the row"""
+    attr_class = ContentImageFieldFile
+
+
+def pop_stored_name(instance, attname):
+    """The file saved to ContentAddressedStorage for the field since the last call, its reference is already counted"""
+    return instance.__dict__.get('_stored_file_names', {}).pop(attname, None)
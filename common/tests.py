@@ -1,3 +1,161 @@
-from django.test import TestCase
+import datetime
+import io
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from account.models import DEFAULT_AVATAR, User
+from trade.models import Good, UploadedImage
+from .models import StoredFile, TelegramOutboxMessage
+from .services import telegram
+from .management.commands.bench_telegram_sender import start_fake_bot_api
+from .services.telegram_sender import SendReport, SendResult, TelegramSender, TokenBucket
+from .storage import content_storage
+from .utils.testing import TemporaryMediaMixin
+
+
+class ContentAddressedStorageTest(TemporaryMediaMixin, TransactionTestCase):
+    def create_image(self, content):
+        image = UploadedImage()
+        image.image.save('photo.JPG', ContentFile(content))
+        return image
+
+    def test_images(self):
+        first, second = self.create_image(b'photo'), self.create_image(b'photo')
+        other = self.create_image(b'other photo')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(first.image.name.endswith('.jpg'))
+        self.assertNotEqual(first.image.name, other.image.name)
+        self.assertEqual(StoredFile.objects.get(name=first.image.name).references, 2)
+
+        first.delete()
+        self.assertTrue(content_storage.exists(second.image.name))
+        second.image = other.image.name
+        second.save()
+        self.assertFalse(content_storage.exists(first.image.name))
+        self.assertFalse(StoredFile.objects.filter(name=first.image.name).exists())
+        self.assertEqual(StoredFile.objects.get(name=other.image.name).references, 2)
+
+    def test_reference_on_save(self):
+        name = content_storage.save('photo.jpg', ContentFile(b'photo'))
+        self.assertEqual(StoredFile.objects.get(name=name).references, 1)
+        image = self.create_image(b'photo')
+        self.assertEqual(StoredFile.objects.get(name=name).references, 2)
+        # the same content saved again, the image keeps one reference
+        image.image.save('photo.jpg', ContentFile(b'photo'))
+        self.assertEqual(StoredFile.objects.get(name=name).references, 2)
+
+    def test_missing_file(self):
+        # a deletion rolled back after the file had been deleted leaves a StoredFile without the file
+        name = self.create_image(b'photo').image.name
+        content_storage.delete(name)
+        StoredFile.objects.filter(name=name).update(references=0)
+        self.assertEqual(self.create_image(b'photo').image.name, name)
+        with content_storage.open(name) as file:
+            self.assertEqual(file.read(), b'photo')
+        self.assertEqual(StoredFile.objects.get(name=name).references, 1)
+
+    def test_avatar(self):
+        image = self.create_image(b'photo')
+        user = User.objects.create(tg_id='1')
+        self.assertEqual(user.avatar.name, DEFAULT_AVATAR)
+
+        user = User.objects.get(pk=user.pk)
+        user.avatar.save('avatar.jpg', ContentFile(b'photo'))
+        self.assertEqual(user.avatar.name, image.image.name)
+        self.assertEqual(StoredFile.objects.get(name=image.image.name).references, 2)
+        user.description = 'Описание'
+        user.save()
+        self.assertEqual(StoredFile.objects.get(name=image.image.name).references, 2)
+
+        image.delete()
+        user = User.objects.get(pk=user.pk)
+        user.avatar.save('avatar.jpg', ContentFile(b'new photo'))
+        self.assertFalse(content_storage.exists(image.image.name))
+        user.delete()
+        self.assertFalse(content_storage.exists(user.avatar.name))
+
+    def test_collect_orphan_images(self):
+        user = User.objects.create(tg_id='1')
+        good = Good.objects.create(name='Товар', user=user, contacts='-')
+        attached, shared, orphan, recent = (self.create_image(x) for x in (b'a', b'a', b'b' * 1000, b'c'))
+        UploadedImage.objects.filter(pk=attached.pk).update(good=good)
+        UploadedImage.objects.exclude(pk=recent.pk).update(created_at=datetime.datetime(2020, 1, 1))
+
+        out = io.StringIO()
+        call_command('collect_orphan_images', batch_size=1, pause=0, stdout=out)
+        self.assertIn('Deleted 2 images, reclaimed 1000 bytes', out.getvalue())
+        self.assertEqual(set(UploadedImage.objects.values_list('id', flat=True)), {attached.pk, recent.pk})
+        self.assertTrue(content_storage.exists(attached.image.name))
+        self.assertFalse(content_storage.exists(orphan.image.name))
+        self.assertEqual(StoredFile.objects.get(name=shared.image.name).references, 1)
+
+    def test_image_change(self):
+        image = UploadedImage.objects.get(pk=self.create_image(b'photo').pk)
+        old_name = image.image.name
+        with CaptureQueriesContext(connection) as queries:
+            image.save()
+        self.assertEqual(len(queries), 1)  # the UPDATE only, the old file name is known
+
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            image.image.save('photo.jpg', ContentFile(b'new photo'))
+            raise RuntimeError
+        self.assertTrue(content_storage.exists(old_name))
+        self.assertEqual(UploadedImage.objects.get(pk=image.pk).image.name, old_name)
+
+        image = UploadedImage.objects.get(pk=image.pk)
+        image.image.save('photo.jpg', ContentFile(b'new photo'))
+        self.assertFalse(content_storage.exists(old_name))
+
+
+class TelegramOutboxTest(TransactionTestCase):
+    def test_send_outside_transaction(self):
+        telegram.enqueue_messages([('1', 'Первое'), ('2', 'Второе')])
+
+        def send_many(messages):
+            # the batch is leased: nothing is locked and another worker doesn't get it
+            self.assertFalse(connection.in_atomic_block)
+            self.assertEqual(telegram._claim_batch(10), [])
+            return SendReport([SendResult('1', True), SendResult('2', False, error_code=500, error='Error')], 0.1)
+
+        with mock.patch.object(telegram, 'get_sender') as get_sender:
+            get_sender.return_value.send_many.side_effect = send_many
+            self.assertEqual(telegram.send_outbox_batch(), 2)
+
+        message = TelegramOutboxMessage.objects.get()
+        self.assertEqual((message.receiver_id, message.attempts, message.is_failed), ('2', 1, False))
+
+
+class TelegramSenderTest(SimpleTestCase):
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=10, capacity=1)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertAlmostEqual(bucket.reserve(), 0.1, delta=0.05)
+        bucket.pause(1)
+        bucket.pause(1)  # pauses don't add up
+        self.assertAlmostEqual(bucket.reserve(), 1.1, delta=0.05)
+        self.assertFalse(bucket.is_idle())
+
+    def start_server(self, flood_every):
+        server = start_fake_bot_api(flood_every=flood_every)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def test_flood_wait(self):
+        server = self.start_server(flood_every=1)
+        sender = TelegramSender(token='test', api_url=f'http://127.0.0.1:{server.server_port}', max_retries=0)
+        result = sender.send('1', 'Сообщение')
+        self.assertEqual((result.ok, result.error_code, result.retry_after), (False, 429, 1))
+        # the whole bot waits, not only the chat
+        self.assertGreater(sender.global_bucket.reserve(), 0.5)
+
+    def test_retry_after(self):
+        server = self.start_server(flood_every=2)
+        sender = TelegramSender(token='test', api_url=f'http://127.0.0.1:{server.server_port}', max_workers=1)
+        report = sender.send_many([('1', 'Первое', {}), ('2', 'Второе', {})])
+        self.assertEqual((report.sent, report.failed, server.requests), (2, 0, 3))
+        self.assertGreaterEqual(report.elapsed, 1)
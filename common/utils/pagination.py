@@ -0,0 +1,117 @@
+# Keyset (cursor) pagination for DRF views
+import base64
+import datetime
+import json
+from decimal import Decimal
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginates over a unique ordering, e.g. ('-updated_at', '-id').
+    The cursor stores the ordering values of the last row of a page and the next page
+    is selected with a row comparison against them, so a deep page costs the same as the first one.
+    All the ordering fields must have the same direction and be covered by an index.
+    """
+    ordering = ('-updated_at', '-id')
+    page_size = 20
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        position = self.decode_cursor(request, queryset.model)
+        results = list(self.get_page_queryset(queryset, position))
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_page_queryset(self, queryset, position=None):
+        """The page after the position (the first page if it's None), with one extra row to know if there is a next page"""
+        queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            queryset = queryset.filter(self.get_position_filter(position))
+        return queryset[:self.page_size + 1]
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_position_filter(self, position):
+        """(a, b) < (x, y) is expanded to a <= x AND (a < x OR (a = x AND b < y))"""
+        descending = self.ordering[0].startswith('-')
+        names = [x.lstrip('-') for x in self.ordering]
+        lookup = 'lt' if descending else 'gt'
+
+        position_filter = Q()
+        for i, name in enumerate(names):
+            condition = Q(**{f'{name}__{lookup}': position[i]})
+            for prev_name, value in zip(names[:i], position[:i]):
+                condition &= Q(**{prev_name: value})
+            position_filter |= condition
+        # the leading bound lets the database use an index range scan
+        return Q(**{f'{names[0]}__{lookup}e': position[0]}) & position_filter
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        position = [self._encode_value(getattr(last, x.lstrip('-'))) for x in self.ordering]
+        cursor = base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request, model):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if not isinstance(position, list) or len(position) != len(self.ordering):
+                raise ValueError
+            return [self._decode_value(model, x.lstrip('-'), value) for x, value in zip(self.ordering, position)]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def _encode_value(value):
+        if isinstance(value, (datetime.date, datetime.datetime)):
+            return value.isoformat()
+        if isinstance(value, Decimal):
+            return str(value)
+        return value
+
+    @staticmethod
+    def _decode_value(model, name, value):
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:  # an annotation, e.g. a search rank
+            return value
+        return field.to_python(value)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
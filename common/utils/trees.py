@@ -1,11 +1,26 @@
 # Functions for working with trees, serializing trees etc
+from collections import defaultdict
 
 
-def serialize_tree(root, all_nodes, serializer_cls):
-    result = serializer_cls(instance=root).data
-    result['children'] = []
+def serialize_trees(all_nodes, serializer_cls, sort_key='sort_order'):
+    """
+    Serializes a forest of nodes (each node has `id` and `parent_id`) in one pass.
+    Returns a list of root nodes, every serialized node gets a `children` list.
+    """
+    all_nodes = list(all_nodes)
+    serialized = dict(zip(
+        (node.id for node in all_nodes),
+        serializer_cls(instance=all_nodes, many=True).data,
+    ))
+
+    children = defaultdict(list)
+    for node in all_nodes:
+        children[node.parent_id].append(serialized[node.id])
+
+    roots = []
     for node in all_nodes:
-        if node.parent == root:
-            result['children'].append(serialize_tree(node, all_nodes, serializer_cls))
-    result['children'] = sorted(result['children'], key=lambda x: x['sort_order'])
-    return result
\ No newline at end of file
+        result = serialized[node.id]
+        result['children'] = sorted(children[node.id], key=lambda x: x[sort_key])
+        if node.parent_id is None or node.parent_id not in serialized:
+            roots.append(result)
+    return sorted(roots, key=lambda x: x[sort_key])
@@ -0,0 +1,71 @@
+# Upload handlers
+import hashlib
+
+from django.conf import settings
+from django.core.files.uploadhandler import StopUpload, TemporaryFileUploadHandler
+from django.http import QueryDict
+from django.utils.datastructures import MultiValueDict
+from PIL import Image
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """
+    Streams an uploaded image to a temporary file, so the memory of a request doesn't depend on the file size.
+    The upload is stopped as soon as it's larger than max_bytes, the dimensions are checked from the image header
+    without decoding it. The file gets `sha256` of its content and `image_size`, the size as displayed
+    (the EXIF orientation is applied).
+    On a failed check the file is dropped and `error` is set.
+    """
+    MULTIPART_OVERHEAD = 64 * 1024
+    EXIF_ORIENTATION = 0x0112
+    # the orientations rotating the image by 90 or 270 degrees
+    TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+    def __init__(self, request=None, max_bytes=None, max_pixels=None):
+        super().__init__(request)
+        self.max_bytes = max_bytes or settings.IMAGE_UPLOAD_MAX_BYTES
+        self.max_pixels = max_pixels or settings.IMAGE_UPLOAD_MAX_PIXELS
+        self.error = None
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        # the body is not read at all if the request is declared too large
+        if content_length > self.max_bytes + self.MULTIPART_OVERHEAD:
+            self.error = self.size_error()
+            return QueryDict(encoding=encoding), MultiValueDict()
+        return None
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.size = 0
+        self.hash = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        if self.size > self.max_bytes:
+            self.error = self.size_error()
+            raise StopUpload(connection_reset=True)
+        self.hash.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        try:
+            # opening reads the header only, the pixels are not decoded
+            with Image.open(file.temporary_file_path()) as image:
+                width, height = image.size
+                if image.getexif().get(self.EXIF_ORIENTATION) in self.TRANSPOSED_ORIENTATIONS:
+                    width, height = height, width
+        except (OSError, Image.DecompressionBombError):
+            self.error = "Файл не является изображением"
+        else:
+            if width * height > self.max_pixels:
+                self.error = f"Изображение больше {self.max_pixels // 1000000} Мп"
+        if self.error:
+            file.close()
+            return None
+        file.sha256 = self.hash.hexdigest()
+        file.image_size = (width, height)
+        return file
+
+    def size_error(self):
+        return f"Файл больше {self.max_bytes // (1024 * 1024)} МБ"
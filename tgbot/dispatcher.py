@@ -0,0 +1,124 @@
+import logging
+import queue
+import threading
+import time
+
+import telebot
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+def get_chat_id(update):
+    """The chat the update belongs to, the updates of one chat are handled in order"""
+    for name in ('message', 'edited_message', 'channel_post', 'edited_channel_post',
+                 'my_chat_member', 'chat_member', 'chat_join_request'):
+        obj = getattr(update, name, None)
+        if obj is not None:
+            return obj.chat.id
+    for name in ('callback_query', 'inline_query', 'chosen_inline_result', 'shipping_query',
+                 'pre_checkout_query', 'poll_answer'):
+        obj = getattr(update, name, None)
+        if obj is not None:
+            user = getattr(obj, 'from_user', None) or getattr(obj, 'user', None)
+            if user is not None:
+                return user.id
+    return update.update_id
+
+
+class PoolMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.handled = 0
+        self.failed = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def observe(self, latency: float, ok: bool):
+        with self.lock:
+            self.handled += 1
+            self.failed += not ok
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                'handled': self.handled,
+                'failed': self.failed,
+                'latency_avg': self.latency_total / self.handled if self.handled else 0.0,
+                'latency_max': self.latency_max,
+            }
+
+
+class ChatOrderedPool:
+    """
+    Worker threads with a queue each. The tasks of one chat always go to the same worker,
+    so they run in order while different chats are served concurrently.
+    The database connections are closed around every task, as Django does around a request.
+    """
+
+    def __init__(self, workers: int):
+        self.queues = [queue.Queue() for _ in range(workers)]
+        self.metrics = PoolMetrics()
+        self.started = False
+        self.start_lock = threading.Lock()
+
+    def _start(self):
+        """The threads are started by the first task, so importing the bot doesn't start them"""
+        with self.start_lock:
+            if self.started:
+                return
+            for i, tasks in enumerate(self.queues):
+                threading.Thread(target=self._work, args=(tasks,), name=f'tgbot-worker-{i}', daemon=True).start()
+            self.started = True
+
+    def submit(self, chat_id, task):
+        if not self.started:
+            self._start()
+        self.queues[hash(chat_id) % len(self.queues)].put((time.monotonic(), task))
+
+    def _work(self, tasks):
+        while True:
+            enqueued_at, task = tasks.get()
+            ok = True
+            close_old_connections()
+            try:
+                task()
+            except Exception:
+                ok = False
+                logger.exception("The bot update is not handled")
+            finally:
+                close_old_connections()
+                # the latency includes the waiting in the queue
+                self.metrics.observe(time.monotonic() - enqueued_at, ok)
+                tasks.task_done()
+
+    def queue_depth(self) -> int:
+        return sum(x.qsize() for x in self.queues)
+
+    def stats(self) -> dict:
+        return {
+            'workers': len(self.queues),
+            'queue_depth': self.queue_depth(),
+            'queue_depth_max': max(x.qsize() for x in self.queues),
+            **self.metrics.snapshot(),
+        }
+
+
+class PooledTeleBot(telebot.TeleBot):
+    """Handles the updates in a ChatOrderedPool, both polling and the webhook pass the updates here"""
+
+    def __init__(self, token, workers: int, **kwargs):
+        # the handlers run right in the pool workers, not in the TeleBot thread pool
+        super().__init__(token, threaded=False, **kwargs)
+        self.pool = ChatOrderedPool(workers)
+
+    def process_new_updates(self, updates):
+        # polling asks for the updates after last_update_id, TeleBot advances it only while handling them,
+        # so it is advanced here before the updates go to the workers
+        if updates:
+            self.last_update_id = max(self.last_update_id, max(x.update_id for x in updates))
+        process = super().process_new_updates
+        for update in updates:
+            self.pool.submit(get_chat_id(update), lambda update=update: process([update]))
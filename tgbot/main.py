@@ -1,52 +1,33 @@
 import telebot
 from django.conf import settings
-from account.services.registration import generate_confirm_code
-from django.core.cache import cache
-from account.models import User
+from account.services.registration import LOGIN, REGISTER, is_registered, issue_confirm_code
+from .dispatcher import PooledTeleBot
 
 
-bot = telebot.TeleBot(settings.INFO_BOT_TOKEN)
+bot = PooledTeleBot(settings.INFO_BOT_TOKEN, workers=settings.TELEGRAM_BOT_WORKERS)
 
 
 @bot.message_handler(commands=['start'])
 def start_message(message):
-    try:
-        User.objects.get(tg_id=message.chat.id)
+    if is_registered(message.chat.id):
         bot.send_message(message.chat.id, "Вы уже зарегистрировались, используйте команду /login")
         return
-    except User.DoesNotExist:
-        pass
-    cache_code = cache.get(f'login_tg_{message.chat.id}')
-    if not cache_code:
-        code = generate_confirm_code()
-        cache.set(f'register_code_{code}', message.chat.id, settings.USER_CONFIRM_TG_TIMEOUT)
-        cache.set(f'register_tg_{message.chat.id}', code, settings.USER_CONFIRM_TG_TIMEOUT)
-
-    else:
-        code = cache_code
+    code = issue_confirm_code(REGISTER, message.chat.id)
     msg = settings.CONFIRM_REGISTER_MESSAGE.substitute(code=code)
     bot.send_message(message.chat.id, msg)
 
 
 @bot.message_handler(commands=['login'])
 def login(message):
-    try:
-        User.objects.get(tg_id=message.chat.id)
-    except User.DoesNotExist:
+    if not is_registered(message.chat.id):
         bot.send_message(message.chat.id, 'Сначала пройдите регистрацию на сайте!')
         return
-
-    cache_code = cache.get(f'login_tg_{message.chat.id}')
-    if not cache_code:
-        code = generate_confirm_code()
-        cache.set(f'login_code_{code}', message.chat.id, settings.USER_CONFIRM_TG_TIMEOUT)
-        cache.set(f'login_tg_{message.chat.id}', code, settings.USER_CONFIRM_TG_TIMEOUT)
-    else:
-        code = cache_code
+    code = issue_confirm_code(LOGIN, message.chat.id)
     msg = settings.CONFIRM_LOGIN_MESSAGE.substitute(code=code)
     bot.send_message(message.chat.id, msg)
 
 
 def run_polling():
+    """For development, in production the updates come to the webhook, see tgbot.views"""
     print("The bot has started")
     bot.polling(non_stop=True)
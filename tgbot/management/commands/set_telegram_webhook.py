@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from tgbot.main import bot
+
+
+class Command(BaseCommand):
+    help = "Points the bot webhook to this site. With --delete the webhook is removed and polling can be used again"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delete', action='store_true')
+        parser.add_argument('--url', help="The webhook url, SITE_DOMAIN + the webhook view by default")
+        parser.add_argument('--drop-pending-updates', action='store_true')
+
+    def handle(self, *args, **options):
+        if options['delete']:
+            bot.remove_webhook()
+            self.stdout.write("The webhook is removed")
+            return
+        if not settings.TELEGRAM_WEBHOOK_SECRET:
+            raise CommandError("Set TELEGRAM_WEBHOOK_SECRET")
+
+        url = options['url'] or settings.SITE_DOMAIN + reverse('tgbot_webhook')
+        bot.set_webhook(url=url, secret_token=settings.TELEGRAM_WEBHOOK_SECRET,
+                        max_connections=settings.TELEGRAM_WEBHOOK_MAX_CONNECTIONS,
+                        drop_pending_updates=options['drop_pending_updates'] or None)
+        self.stdout.write(f"The webhook is set to {url}")
@@ -0,0 +1,79 @@
+import json
+import time
+from unittest import mock
+
+import telebot
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from .dispatcher import ChatOrderedPool, PooledTeleBot
+from .main import bot
+
+
+@override_settings(TELEGRAM_WEBHOOK_SECRET='secret')
+class WebhookTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def post(self, update_id, secret='secret'):
+        update = {'update_id': update_id, 'message': {
+            'message_id': 1, 'date': 0, 'chat': {'id': 1, 'type': 'private'}, 'text': '/start',
+        }}
+        return self.client.post('/tgbot/webhook', json.dumps(update), content_type='application/json',
+                                HTTP_X_TELEGRAM_BOT_API_SECRET_TOKEN=secret)
+
+    @mock.patch.object(bot, 'process_new_updates')
+    def test_secret(self, process_new_updates):
+        self.assertEqual(self.post(1, secret='wrong').status_code, 403)
+        process_new_updates.assert_not_called()
+
+    @mock.patch.object(bot, 'process_new_updates')
+    def test_duplicates(self, process_new_updates):
+        self.assertEqual(self.post(1).status_code, 200)
+        self.assertEqual(self.post(1).status_code, 200)
+        self.assertEqual(self.post(2).status_code, 200)
+        self.assertEqual([x.args[0][0].update_id for x in process_new_updates.call_args_list], [1, 2])
+
+
+class ChatOrderedPoolTest(TestCase):
+    def test_chat_order(self):
+        pool = ChatOrderedPool(workers=4)
+        handled = {1: [], 2: []}
+        for i in range(20):
+            chat_id = i % 2 + 1
+            pool.submit(chat_id, lambda chat_id=chat_id, i=i: (time.sleep(0.001), handled[chat_id].append(i)))
+        pool.submit(1, lambda: 1 / 0)
+        for tasks in pool.queues:
+            tasks.join()
+
+        self.assertEqual(handled[1], list(range(0, 20, 2)))
+        self.assertEqual(handled[2], list(range(1, 20, 2)))
+        stats = pool.stats()
+        self.assertEqual((stats['handled'], stats['failed'], stats['queue_depth']), (21, 1, 0))
+
+
+class PollingTest(TestCase):
+    def test_updates_handled_once(self):
+        polling_bot = PooledTeleBot('1:test', workers=2)
+        handled = []
+        polling_bot.message_handler(func=lambda message: True)(lambda message: handled.append(message.message_id))
+
+        def update(update_id):
+            return telebot.types.Update.de_json({'update_id': update_id, 'message': {
+                'message_id': update_id, 'date': 0, 'chat': {'id': update_id, 'type': 'private'}, 'text': 'text',
+            }})
+
+        offsets = []
+
+        def get_updates(offset, **kwargs):
+            offsets.append(offset)
+            return [update(x) for x in (1, 2) if x >= offset]
+
+        with mock.patch.object(polling_bot, 'get_updates', side_effect=get_updates):
+            for _ in range(3):
+                polling_bot._TeleBot__retrieve_updates(timeout=0)
+        for tasks in polling_bot.pool.queues:
+            tasks.join()
+
+        self.assertEqual(offsets, [1, 3, 3])
+        self.assertEqual(sorted(handled), [1, 2])
@@ -0,0 +1,8 @@
+from django.urls import path
+from . import views
+
+
+urlpatterns = [
+    path('webhook', views.webhook_view, name='tgbot_webhook'),
+    path('metrics', views.MetricsAPIView.as_view()),
+]
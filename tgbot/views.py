@@ -0,0 +1,47 @@
+import json
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from telebot.types import Update
+
+from .main import bot
+
+SECRET_TOKEN_HEADER = 'HTTP_X_TELEGRAM_BOT_API_SECRET_TOKEN'
+
+
+@csrf_exempt
+@require_POST
+def webhook_view(request):
+    """
+    Receives the bot updates from Telegram, see set_telegram_webhook. The handlers run in the bot worker threads,
+    an update delivered again (a retry or another replica) is skipped by its update_id.
+    """
+    secret = settings.TELEGRAM_WEBHOOK_SECRET
+    if not secret or not constant_time_compare(request.META.get(SECRET_TOKEN_HEADER, ''), secret):
+        return HttpResponseForbidden()
+    try:
+        update = Update.de_json(json.loads(request.body))
+    except (ValueError, KeyError, TypeError):
+        return HttpResponseBadRequest()
+
+    if not cache.add(f'tg_update_{update.update_id}', 1, settings.TELEGRAM_UPDATE_DEDUPE_TIMEOUT):
+        logging.getLogger(__name__).info(f"Telegram update {update.update_id} is already processed")
+        return HttpResponse()
+    bot.process_new_updates([update])
+    return HttpResponse()
+
+
+class MetricsAPIView(APIView):
+    """Queue depth and handling latency of the bot workers of this process"""
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(bot.pool.stats())
@@ -1,18 +1,34 @@
 from adminsortable2.admin import SortableAdminMixin
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.db import transaction
+
 from .models import *
+from .services.categories import bump_categories_version
 
 
 @admin.register(GoodCategory)
 class GoodCategoryAdmin(SortableAdminMixin, admin.ModelAdmin):
     list_display = ("sort_order", "full_name", "is_service")
-    search_fields = ("name", "id__iexact")
+    search_fields = ("full_name", "id__iexact")
 
     def full_name(self, obj):
-        return str(obj)
+        return obj.full_name
 
     full_name.short_description = 'Название'
-    full_name.admin_order_field = 'parent'
+    full_name.admin_order_field = 'full_name'
+
+    # reordering is done with bulk queries which don't send model signals
+    def _update_order(self, updated_items, extra_model_filters):
+        result = super()._update_order(updated_items, extra_model_filters)
+        transaction.on_commit(bump_categories_version)
+        return result
+
+    def _move_item(self, startorder, endorder, extra_model_filters):
+        result = super()._move_item(startorder, endorder, extra_model_filters)
+        transaction.on_commit(bump_categories_version)
+        return result
 
     # ordering = ['sort_order']
 
@@ -24,10 +40,50 @@ class UploadedImageInlineAdmin(admin.TabularInline):
 @admin.register(Good)
 class GoodAdmin(admin.ModelAdmin):
     list_display = ("id", "name", "user", "category", "updated_at")
+    list_select_related = ("user", "category")
     search_fields = ("name", "id__iexact")
     list_filter = ("category", )
     inlines = [UploadedImageInlineAdmin, ]
 
+    def get_search_results(self, request, queryset, search_term):
+        """Uses the full-text search index instead of icontains scans"""
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        if search_term.isdigit():
+            return queryset.filter(pk=search_term) | queryset.matching(search_term), False
+        return queryset.matching(search_term), False
+
+
+class ModerationActionForm(ActionForm):
+    reason = forms.CharField(label="Причина отказа", required=False)
+
+
+@admin.register(GoodOnModeration)
+class GoodOnModerationAdmin(GoodAdmin):
+    """The moderation queue, the longest waiting goods go first"""
+    list_display = ("id", "name", "user", "category", "updated_at")
+    ordering = ("updated_at", "id")
+    action_form = ModerationActionForm
+    actions = ("approve", "disallow")
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).filter(state=Good.PublishState.MODERATION)
+
+    @admin.action(description="Опубликовать выбранные товары")
+    def approve(self, request, queryset):
+        goods = queryset.approve()
+        self.message_user(request, f"Опубликовано товаров: {len(goods)}")
+
+    @admin.action(description="Запретить выбранные товары")
+    def disallow(self, request, queryset):
+        reason = request.POST.get('reason', '').strip()
+        if not reason:
+            self.message_user(request, "Укажите причину отказа", messages.ERROR)
+            return
+        goods = queryset.disallow(reason)
+        self.message_user(request, f"Запрещено товаров: {len(goods)}")
+
 
 @admin.register(UploadedImage)
 class UploadedImageAdmin(admin.ModelAdmin):
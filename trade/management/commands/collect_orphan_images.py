@@ -0,0 +1,71 @@
+import datetime
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import router, transaction
+from django.db.models import Q
+from django.db.models.deletion import Collector
+
+from common.services.files import delete_files, drop_references, take_unreferenced_files
+from common.storage import content_storage
+from trade.models import UploadedImage
+from trade.services.images import variants_names
+
+
+class Command(BaseCommand):
+    help = "Deletes the uploaded images which are not attached to a good for ORPHAN_IMAGES_GRACE_PERIOD"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-period', type=int, default=settings.ORPHAN_IMAGES_GRACE_PERIOD, help="Seconds")
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--pause', type=float, default=0.1, help="Seconds between batches")
+        parser.add_argument('--workers', type=int, default=settings.FILE_DELETION_WORKERS)
+
+    def handle(self, *args, **options):
+        created_before = datetime.datetime.now() - datetime.timedelta(seconds=options['grace_period'])
+        deleted = reclaimed = 0
+        position = None
+        while True:
+            queryset = UploadedImage.objects.filter(good__isnull=True, created_at__lt=created_before)
+            if position is not None:
+                # the images skipped as locked are not scanned again
+                queryset = queryset.filter(Q(created_at__gt=position[0]) | Q(created_at=position[0], id__gt=position[1]))
+            batch = list(queryset.order_by('created_at', 'id').values_list('created_at', 'id')[:options['batch_size']])
+            if not batch:
+                break
+            position = batch[-1]
+
+            count, names, files = self.delete_batch([x[1] for x in batch])
+            deleted += count
+            with transaction.atomic():
+                # deleted under the locks of the StoredFile rows, see ContentAddressedStorage._save
+                files += take_unreferenced_files(names)
+                reclaimed += delete_files(content_storage, files, options['workers'])
+            time.sleep(options['pause'])
+
+        self.stdout.write(f"Deleted {deleted} images, reclaimed {reclaimed} bytes")
+
+    @staticmethod
+    def delete_batch(ids):
+        """
+        Deletes the images which are still orphans and drops the references to their files and variants.
+        Returns their number, the released files and the untracked files to delete
+        """
+        with transaction.atomic():
+            # an image being attached to a good right now is locked and skipped
+            images = list(UploadedImage.objects.select_for_update(skip_locked=True)
+                          .filter(pk__in=ids, good__isnull=True))
+            if not images:
+                return 0, [], []
+            for image in images:
+                image._files_released = True
+            collector = Collector(using=router.db_for_write(UploadedImage))
+            collector.collect(images)
+            collector.delete()
+
+            names = [x.image.name for x in images if x.image]
+            names += [name for x in images for name in variants_names(x.variants)]
+            files = drop_references(names)
+        # the files are deleted after commit, a rollback keeps them
+        return len(images), names, files
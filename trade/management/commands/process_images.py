@@ -0,0 +1,63 @@
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from common.services.files import release_files
+from trade.models import UploadedImage
+from trade.services.images import process_image, variants_names
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Makes the resized variants of the uploaded images in a process pool. Runs forever unless --once is given"
+    FIELDS = ['width', 'height', 'placeholder', 'variants', 'is_processed']
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Process all the waiting images and exit")
+        parser.add_argument('--batch-size', type=int, default=settings.IMAGE_PROCESSING_BATCH_SIZE)
+        parser.add_argument('--workers', type=int, default=settings.IMAGE_PROCESSING_WORKERS)
+
+    def handle(self, *args, **options):
+        # the workers must not share the connection of the parent, ContentAddressedStorage opens their own ones
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as executor:
+            while True:
+                processed = self.process_batch(executor, options['batch_size'])
+                if processed:
+                    self.stdout.write(f"Processed {processed} images")
+                    continue
+                if options['once']:
+                    return
+                time.sleep(settings.IMAGE_PROCESSING_POLL_INTERVAL)
+
+    def process_batch(self, executor, batch_size) -> int:
+        images = list(UploadedImage.objects.filter(is_processed=False).order_by('id')[:batch_size])
+        futures = {executor.submit(process_image, x.image.name, settings.IMAGE_VARIANT_WIDTHS, x.image.storage): x
+                   for x in images}
+        for future in as_completed(futures):
+            image = futures[future]
+            image.is_processed = True
+            try:
+                for name, value in future.result().items():
+                    setattr(image, name, value)
+            except Exception:
+                # a broken or missing file, it is served as is
+                logger.exception(f"The image id{image.id} {image.image.name} is not processed")
+
+        with transaction.atomic():
+            # the variants of the images deleted or given another file in the meantime are not needed,
+            # the rows are locked, so the file can't be replaced until the variants are saved
+            current_names = dict(UploadedImage.objects.select_for_update()
+                                 .filter(pk__in=[x.pk for x in images]).values_list('id', 'image'))
+            for image in images:
+                if current_names.get(image.pk) != image.image.name:
+                    release_files(image.image.storage, variants_names(image.variants))
+            UploadedImage.objects.bulk_update([x for x in images if current_names.get(x.pk) == x.image.name],
+                                              self.FIELDS)
+        return len(images)
@@ -0,0 +1,25 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from trade.services.notifications import send_moderation_digest
+
+
+class Command(BaseCommand):
+    help = "Sends the moderators a digest of the goods on moderation every MODERATION_DIGEST_INTERVAL seconds. " \
+           "Runs forever unless --once is given"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Send the collected goods and exit")
+
+    def handle(self, *args, **options):
+        if not options['once'] and not settings.MODERATION_DIGEST_INTERVAL:
+            raise CommandError("The digest mode is off, set MODERATION_DIGEST_INTERVAL")
+        while True:
+            count = send_moderation_digest()
+            if count:
+                self.stdout.write(f"Sent a digest of {count} goods")
+            if options['once']:
+                return
+            time.sleep(settings.MODERATION_DIGEST_INTERVAL)
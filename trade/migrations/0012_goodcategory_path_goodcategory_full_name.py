@@ -0,0 +1,45 @@
+# Generated by Django 4.0.1 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+def fill_paths(apps, schema_editor):
+    GoodCategory = apps.get_model('trade', 'GoodCategory')
+    categories = {x.pk: x for x in GoodCategory.objects.all()}
+
+    def build(category, visited=()):
+        if category.path:
+            return
+        parent = categories.get(category.parent_id)
+        if parent is None or parent.pk in visited:
+            category.path = f'{category.pk}/'
+            category.full_name = category.name
+            return
+        build(parent, visited + (category.pk,))
+        category.path = f'{parent.path}{category.pk}/'
+        category.full_name = f'{parent.full_name} > {category.name}'
+
+    for category in categories.values():
+        build(category)
+    GoodCategory.objects.bulk_update(categories.values(), ['path', 'full_name'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trade', '0011_rename_user_uploadedimage_good'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='goodcategory',
+            name='full_name',
+            field=models.CharField(blank=True, editable=False, max_length=1024, verbose_name='Полное название'),
+        ),
+        migrations.AddField(
+            model_name='goodcategory',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=255, verbose_name='Путь'),
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.0.1 on 2026-10-18 10:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trade', '0012_goodcategory_path_goodcategory_full_name'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='uploadedimage',
+            name='good',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='images', to='trade.good'),
+        ),
+        migrations.AddIndex(
+            model_name='good',
+            index=models.Index(fields=['user', '-updated_at', '-id'], name='good_user_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='good',
+            index=models.Index(condition=models.Q(('state', 3)), fields=['-updated_at', '-id'], name='good_published_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.0.1 on 2026-10-18 10:57
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+def fill_search_vector(apps, schema_editor):
+    Good = apps.get_model('trade', 'Good')
+    GoodCategory = apps.get_model('trade', 'GoodCategory')
+    category_name = GoodCategory.objects.filter(pk=OuterRef('category_id')).values('full_name')
+    Good.objects.update(search_vector=(
+        SearchVector('name', weight='A', config='russian')
+        + SearchVector(Subquery(category_name), weight='B', config='russian')
+        + SearchVector('description', weight='C', config='russian')
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trade', '0013_good_good_user_updated_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='good',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='good',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='good_search_vector_idx'),
+        ),
+        migrations.RunPython(fill_search_vector, migrations.RunPython.noop),
+    ]
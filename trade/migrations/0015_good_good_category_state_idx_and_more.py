@@ -0,0 +1,21 @@
+# Generated by Django 4.0.1 on 2026-10-18 11:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trade', '0014_good_search_vector_good_good_search_vector_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='good',
+            index=models.Index(fields=['category', 'state', '-updated_at'], name='good_category_state_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='uploadedimage',
+            index=models.Index(fields=['good', 'id'], name='uploadedimage_good_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.0.1 on 2026-10-18 11:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trade', '0015_good_good_category_state_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='good',
+            index=models.Index(condition=models.Q(('price_currency__gte', 0), ('state', 3)), fields=['price_currency'], name='good_published_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='good',
+            index=models.Index(condition=models.Q(('price_gifts__gte', 0), ('state', 3)), fields=['price_gifts'], name='good_published_gifts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='good',
+            index=models.Index(condition=models.Q(('ready_to_change', True), ('state', 3)), fields=['-updated_at', '-id'], name='good_published_exchange_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.0.1 on 2026-10-18 11:07
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trade', '0016_good_good_published_price_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingModeration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('good', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='trade.good', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Товар для дайджеста модераторов',
+                'verbose_name_plural': 'Товары для дайджеста модераторов',
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.0.1 on 2026-10-18 11:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trade', '0017_pendingmoderation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GoodOnModeration',
+            fields=[
+            ],
+            options={
+                'verbose_name': 'Товар на модерации',
+                'verbose_name_plural': 'Товары на модерации',
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('trade.good',),
+        ),
+        migrations.AddIndex(
+            model_name='good',
+            index=models.Index(condition=models.Q(('state', 1)), fields=['updated_at', 'id'], name='good_moderation_updated_idx'),
+        ),
+    ]
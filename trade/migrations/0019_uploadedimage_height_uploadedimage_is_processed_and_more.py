@@ -0,0 +1,42 @@
+# Generated by Django 4.0.1 on 2026-10-18 11:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trade', '0018_goodonmoderation_good_good_moderation_updated_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadedimage',
+            name='height',
+            field=models.PositiveIntegerField(editable=False, null=True, verbose_name='Высота'),
+        ),
+        migrations.AddField(
+            model_name='uploadedimage',
+            name='is_processed',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Обработано'),
+        ),
+        migrations.AddField(
+            model_name='uploadedimage',
+            name='placeholder',
+            field=models.TextField(blank=True, editable=False, verbose_name='Заглушка'),
+        ),
+        migrations.AddField(
+            model_name='uploadedimage',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Уменьшенные копии'),
+        ),
+        migrations.AddField(
+            model_name='uploadedimage',
+            name='width',
+            field=models.PositiveIntegerField(editable=False, null=True, verbose_name='Ширина'),
+        ),
+        migrations.AddIndex(
+            model_name='uploadedimage',
+            index=models.Index(condition=models.Q(('is_processed', False)), fields=['id'], name='uploadedimage_unprocessed_idx'),
+        ),
+    ]
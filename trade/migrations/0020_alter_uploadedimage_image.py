@@ -0,0 +1,19 @@
+# Generated by Django 4.0.1 on 2026-10-18 11:19
+
+import common.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trade', '0019_uploadedimage_height_uploadedimage_is_processed_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='uploadedimage',
+            name='image',
+            field=models.ImageField(storage=common.storage.ContentAddressedStorage(), upload_to='photos/%Y/%m/%d'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.0.1 on 2026-10-18 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trade', '0020_alter_uploadedimage_image'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='uploadedimage',
+            index=models.Index(condition=models.Q(('good__isnull', True)), fields=['created_at', 'id'], name='uploadedimage_orphan_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.0.1 on 2026-10-18 11:31
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_uploaders(apps, schema_editor):
+    # the uploaders of the attached images are the authors of the goods, the orphans are left to collect_orphan_images
+    UploadedImage = apps.get_model('trade', 'UploadedImage')
+    Good = apps.get_model('trade', 'Good')
+    UploadedImage.objects.filter(good__isnull=False).update(
+        uploader=models.Subquery(Good.objects.filter(pk=models.OuterRef('good_id')).values('user_id')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('trade', '0021_uploadedimage_uploadedimage_orphan_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadedimage',
+            name='uploader',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='uploaded_images', to=settings.AUTH_USER_MODEL, verbose_name='Загрузил'),
+        ),
+        migrations.RunPython(fill_uploaders, migrations.RunPython.noop),
+    ]
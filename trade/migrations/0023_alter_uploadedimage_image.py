@@ -0,0 +1,19 @@
+# Generated by Django 4.0.1 on 2026-10-18 11:38
+
+import common.storage
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trade', '0022_uploadedimage_uploader'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='uploadedimage',
+            name='image',
+            field=common.storage.ContentImageField(storage=common.storage.ContentAddressedStorage(), upload_to='photos/%Y/%m/%d'),
+        ),
+    ]
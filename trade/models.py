@@ -1,43 +1,176 @@
 from decimal import Decimal
 
-from django.conf import settings
 from django.contrib import auth
-from django.contrib.auth import get_user_model
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, SearchVectorField
+from django.core.exceptions import ValidationError
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
-from django.db.models import signals
+from django.db import models, transaction
+from django.db.models import F, FloatField, OuterRef, Prefetch, Subquery, signals
+from django.db.models.functions import Cast
 from django.dispatch import receiver
-from django.template import loader
+from django.utils import timezone
 
-from common.services.telegram import multiple_send_msg
+from common.services.files import release_files, update_references
+from common.storage import ContentImageField, content_storage, pop_stored_name
+from .services.categories import bump_categories_version
+from .services.images import variants_names
 
 
 class GoodCategory(models.Model):
+    PATH_SEPARATOR = '/'
+    FULL_NAME_SEPARATOR = ' > '
+
     name = models.CharField("Название", max_length=128)
     parent = models.ForeignKey("self", on_delete=models.SET_NULL, null=True, blank=True)
     sort_order = models.PositiveIntegerField("✋", default=0, blank=False, null=False)
     is_service = models.BooleanField("Услуга", default=False)
+    # materialized path: ids from the root to the category itself, e.g. "1/5/12/"
+    path = models.CharField("Путь", max_length=255, db_index=True, editable=False, blank=True)
+    full_name = models.CharField("Полное название", max_length=1024, editable=False, blank=True)
 
     class Meta:
         verbose_name = 'Категория товаров/услуг'
         verbose_name_plural = 'Категории товаров/услуг'
         ordering = ['sort_order']
 
+    @property
+    def ancestor_ids(self):
+        return [int(x) for x in self.path.split(self.PATH_SEPARATOR)[:-2]]
 
     @property
     def parents(self):
-        parents = []
-        current = self
-        while current.parent:
-            parents.append(current.parent)
-            current = current.parent
-        return parents
+        """Ancestors from the nearest one to the root, loaded by one query"""
+        ancestors = GoodCategory.objects.in_bulk(self.ancestor_ids)
+        return [ancestors[i] for i in reversed(self.ancestor_ids) if i in ancestors]
+
+    def subtree(self):
+        """The category and all its descendants"""
+        return GoodCategory.objects.filter(path__startswith=self.path)
+
+    def clean(self):
+        if self.pk and self.parent_id and str(self.pk) in self.parent.path.split(self.PATH_SEPARATOR):
+            raise ValidationError({'parent': "Нельзя переместить категорию внутрь неё самой"})
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and not {'name', 'parent'} & set(update_fields):
+            return super().save(*args, **kwargs)
 
+        parent = None
+        if self.parent_id:
+            parent = GoodCategory.objects.only('path', 'full_name').get(pk=self.parent_id)
+            if self.pk and str(self.pk) in parent.path.split(self.PATH_SEPARATOR):
+                raise ValueError("A category can't be moved into its own subtree")
+        super().save(*args, **kwargs)
+        self._update_path(parent)
+
+    def _update_path(self, parent):
+        path = f'{parent.path if parent else ""}{self.pk}{self.PATH_SEPARATOR}'
+        full_name = f'{parent.full_name}{self.FULL_NAME_SEPARATOR}{self.name}' if parent else self.name
+        if path == self.path and full_name == self.full_name:
+            return
+
+        old_path = self.path
+        self.path, self.full_name = path, full_name
+        GoodCategory.objects.filter(pk=self.pk).update(path=path, full_name=full_name)
+        if old_path:
+            self._update_descendants(old_path)
+        # full names of the categories are a part of the goods search index
+        Good.objects.filter(category__path__startswith=path).update_search_vector()
+
+    def _update_descendants(self, old_path):
+        # rebuild the subtree from the top to the bottom, so parents are always processed before children
+        descendants = sorted(
+            GoodCategory.objects.filter(path__startswith=old_path).exclude(pk=self.pk),
+            key=lambda x: x.path.count(self.PATH_SEPARATOR),
+        )
+        full_names = {self.pk: self.full_name}
+        for category in descendants:
+            category.path = self.path + category.path[len(old_path):]
+            category.full_name = f'{full_names[category.parent_id]}{self.FULL_NAME_SEPARATOR}{category.name}'
+            full_names[category.pk] = category.full_name
+        GoodCategory.objects.bulk_update(descendants, ['path', 'full_name'])
 
     def __str__(self):
-        objects = list(reversed(self.parents))
-        objects.append(self)
-        return ' > '.join(map(lambda x: x.name, objects))
+        return self.full_name or self.name
+
+
+@receiver(signals.post_save, sender=GoodCategory, dispatch_uid='category_saved')
+@receiver(signals.post_delete, sender=GoodCategory, dispatch_uid='category_deleted')
+def category_changed(sender, **kwargs):
+    # bump after commit, so nobody can cache a snapshot of not committed data under the new version
+    transaction.on_commit(bump_categories_version)
+
+
+@receiver(signals.post_delete, sender=GoodCategory, dispatch_uid='category_deleted_reroot')
+def category_deleted(sender, instance, **kwargs):
+    """Children of a deleted category become roots (parent is SET_NULL), so their paths are rebuilt"""
+    orphans = GoodCategory.objects.filter(parent__isnull=True, path__startswith=instance.path).exclude(pk=instance.pk)
+    for category in orphans:
+        category.save(update_fields=['parent'])
+
+
+class GoodQuerySet(models.QuerySet):
+    SEARCH_CONFIG = 'russian'
+
+    def with_related(self):
+        """Everything GoodSerializer reads, so the number of queries doesn't depend on the number of goods"""
+        return self.select_related('category', 'user').prefetch_related(
+            Prefetch('images', queryset=UploadedImage.objects.order_by('id'))
+        )
+
+    def update_search_vector(self):
+        category_name = GoodCategory.objects.filter(pk=OuterRef('category_id')).values('full_name')
+        return self.update(search_vector=(
+            SearchVector('name', weight='A', config=self.SEARCH_CONFIG)
+            + SearchVector(Subquery(category_name), weight='B', config=self.SEARCH_CONFIG)
+            + SearchVector('description', weight='C', config=self.SEARCH_CONFIG)
+        ))
+
+    def search_query(self, text):
+        return SearchQuery(text, config=self.SEARCH_CONFIG, search_type='websearch')
+
+    def matching(self, text):
+        return self.filter(search_vector=self.search_query(text))
+
+    def search(self, text):
+        """Goods matching the text with their `rank` annotated"""
+        query = self.search_query(text)
+        # double precision keeps the rank exact after a round trip through a pagination cursor
+        return self.filter(search_vector=query).annotate(
+            rank=Cast(SearchRank(F('search_vector'), query), FloatField())
+        )
+
+    @transaction.atomic
+    def transition(self, state, **fields):
+        """
+        Moves the goods to the state with one UPDATE and queues one batch of notifications.
+        Goods already in the state are skipped. Returns the moved goods.
+        """
+        from .services.notifications import notify_goods_state
+
+        goods = list(self.exclude(state=state).select_related('category', 'user').select_for_update(of=('self',)))
+        if not goods:
+            return []
+        fields.update(state=state, updated_at=timezone.now())
+        Good.objects.filter(pk__in=[x.pk for x in goods]).update(**fields)
+        for good in goods:
+            for name, value in fields.items():
+                setattr(good, name, value)
+            good._loaded_state = state
+        notify_goods_state(goods)
+        return goods
+
+    def approve(self):
+        """Publishes the goods on moderation"""
+        return self.filter(state=self.model.PublishState.MODERATION).transition(
+            self.model.PublishState.PUBLISHED, moderation_disallow_reason='')
+
+    def disallow(self, reason):
+        """Rejects the goods on moderation"""
+        return self.filter(state=self.model.PublishState.MODERATION).transition(
+            self.model.PublishState.MODERATION_DISALLOW, moderation_disallow_reason=reason)
 
 
 class Good(models.Model):
@@ -72,78 +205,189 @@ class Good(models.Model):
     # images = models.JSONField("Фотографии", blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = GoodQuerySet.as_manager()
+    # the fields of the search vector, see good_search_vector_update
+    SEARCH_FIELDS = ('name', 'description', 'category_id')
+    # the state as it is in the database, None for a new good or a deferred state
+    _loaded_state = None
+    # the values of SEARCH_FIELDS as they are in the database, None for a new good
+    _loaded_search_values = None
 
     class Meta:
         verbose_name = 'Товар/услуга'
         verbose_name_plural = 'Товары/услуги'
+        indexes = [
+            # the list of the user's goods
+            models.Index(fields=['user', '-updated_at', '-id'], name='good_user_updated_idx'),
+            # the feed of published goods, state=3 is PublishState.PUBLISHED
+            models.Index(fields=['-updated_at', '-id'], name='good_published_updated_idx',
+                         condition=models.Q(state=3)),
+            # feed filters, prices equal to NOT_READY_FOR_SELL (-1) are never matched by a price range
+            models.Index(fields=['price_currency'], name='good_published_price_idx',
+                         condition=models.Q(state=3, price_currency__gte=0)),
+            models.Index(fields=['price_gifts'], name='good_published_gifts_idx',
+                         condition=models.Q(state=3, price_gifts__gte=0)),
+            models.Index(fields=['-updated_at', '-id'], name='good_published_exchange_idx',
+                         condition=models.Q(state=3, ready_to_change=True)),
+            # the moderation queue, state=1 is PublishState.MODERATION
+            models.Index(fields=['updated_at', 'id'], name='good_moderation_updated_idx',
+                         condition=models.Q(state=1)),
+            # goods of a category in a state, e.g. the feed filtered by a category
+            models.Index(fields=['category', 'state', '-updated_at'], name='good_category_state_idx'),
+            GinIndex(fields=['search_vector'], name='good_search_vector_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_state = instance.__dict__.get('state')
+        instance._loaded_search_values = instance.get_search_values()
+        return instance
+
+    def get_search_values(self):
+        # deferred fields are not read, they are not saved either
+        return tuple(self.__dict__.get(x) for x in self.SEARCH_FIELDS)
 
     def __str__(self):
         return f"{self.name} (id{self.id} {dict(self.PublishState.choices)[self.state]})"
 
 
 
+@receiver(signals.post_save, sender=Good, dispatch_uid='good_search_vector_updating')
+def good_search_vector_update(sender, instance, created, update_fields=None, **kwargs):
+    """The vector is rebuilt only when the name, the description or the category is changed"""
+    if update_fields is not None and not {'name', 'description', 'category'} & set(update_fields):
+        return
+    loaded_values = instance._loaded_search_values
+    instance._loaded_search_values = instance.get_search_values()
+    if not created and loaded_values == instance._loaded_search_values:
+        return
+    Good.objects.filter(pk=instance.pk).update_search_vector()
+
+
 @receiver(signals.post_save, sender=Good, dispatch_uid='good_updating')
 def good_updated(sender, instance, created, **kwargs):
-    from django.urls import reverse
-    from common.services import telegram
+    """
+    Notifies only about a real state change, saves that keep the state don't notify again.
+    Notifications are queued to the outbox in the same transaction, see send_telegram_outbox
+    """
+    from .services.notifications import notify_goods_state
 
-    if instance.state == Good.PublishState.MODERATION:
-        moderators = get_user_model().objects.filter(groups__id=settings.GROUP_GOODS_MODERATOR_ID)
-        template = loader.get_template('telegram/good_moderation_notify.html')
-        name = f"Id{instance.id} ({instance.type}) {instance.name}"
-        url = settings.SITE_DOMAIN + reverse('admin:trade_good_change', args=(instance.id,))
+    loaded_state = instance._loaded_state
+    instance._loaded_state = instance.state
+    if not created and loaded_state == instance.state:
+        return
+    notify_goods_state([instance])
 
-        name = f"{instance.name} id{instance.id} {str(instance.category)}"
-        telegram.multiple_send_msg(moderators, template.render({"url": url, "name": name}), parse_mode="HTML")
 
-    elif instance.state == Good.PublishState.PUBLISHED:
-        author_id = instance.user.tg_id
-        template = loader.get_template('telegram/good_published_notify.html')
-        telegram.send_message(author_id, template.render({"url": '', "name": instance.name}), parse_mode="HTML")
+class GoodOnModeration(Good):
+    class Meta:
+        proxy = True
+        verbose_name = 'Товар на модерации'
+        verbose_name_plural = 'Товары на модерации'
+
+
+class PendingModeration(models.Model):
+    """A good waiting to be included into the moderators digest, see send_moderation_digest"""
+    good = models.OneToOneField(Good, on_delete=models.CASCADE, verbose_name="Товар")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Товар для дайджеста модераторов'
+        verbose_name_plural = 'Товары для дайджеста модераторов'
+
 
-    elif instance.state == Good.PublishState.MODERATION_DISALLOW:
-        author_id = instance.user.tg_id
-        template = loader.get_template('telegram/good_moder_disallow_notify.html')
-        telegram.send_message(author_id, template.render({"url": '', "name": instance.name}), parse_mode="HTML")
+@receiver(signals.m2m_changed, sender=auth.get_user_model().groups.through, dispatch_uid='moderators_changed')
+@receiver(signals.post_delete, sender=auth.get_user_model(), dispatch_uid='moderator_deleted')
+def moderators_changed(sender, **kwargs):
+    from .services.notifications import invalidate_moderators
+    invalidate_moderators()
 
 
 class UploadedImage(models.Model):
-    image = models.ImageField(upload_to="photos/%Y/%m/%d")
+    image = ContentImageField(upload_to="photos/%Y/%m/%d", storage=content_storage)
     good = models.ForeignKey(Good, on_delete=models.CASCADE, null=True, blank=True, related_name="images")
+    # only the uploader can attach the image to a good
+    uploader = models.ForeignKey(auth.get_user_model(), on_delete=models.CASCADE, null=True, blank=True,
+                                 related_name="uploaded_images", verbose_name="Загрузил")
     created_at = models.DateTimeField(auto_now_add=True)
+    # filled by the process_images command
+    width = models.PositiveIntegerField("Ширина", null=True, editable=False)
+    height = models.PositiveIntegerField("Высота", null=True, editable=False)
+    placeholder = models.TextField("Заглушка", blank=True, editable=False)
+    # {"320": {"jpeg": "photos/.../variants/a_320.jpg", "webp": "photos/.../variants/a_320.webp"}, ...}
+    variants = models.JSONField("Уменьшенные копии", default=dict, blank=True, editable=False)
+    is_processed = models.BooleanField("Обработано", default=False, editable=False)
+    # the file name as it is in the database, None for a new image or a deferred file
+    _loaded_image_name = None
+    # the file replaced by the save in progress, see auto_delete_file_on_change
+    _replaced_image_name = None
 
     class Meta:
         verbose_name = 'Фото товаров/услуг'
         verbose_name_plural = 'Фото товаров/услуг'
+        indexes = [
+            # images of goods are prefetched ordered by id
+            models.Index(fields=['good', 'id'], name='uploadedimage_good_idx'),
+            # the queue of the process_images command
+            models.Index(fields=['id'], name='uploadedimage_unprocessed_idx', condition=models.Q(is_processed=False)),
+            # images not attached to a good, see collect_orphan_images
+            models.Index(fields=['created_at', 'id'], name='uploadedimage_orphan_idx', condition=models.Q(good__isnull=True)),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        image = instance.__dict__.get('image')  # a str until the field is read
+        instance._loaded_image_name = getattr(image, 'name', image)
+        return instance
+
+    def get_variants_urls(self):
+        storage = self.image.storage
+        return {width: {key: storage.url(name) for key, name in formats.items()}
+                for width, formats in self.variants.items()}
 
 @receiver(models.signals.post_delete, sender=UploadedImage)
 def auto_delete_file_on_delete(sender, instance, **kwargs):
     """
-    Deletes file from filesystem
-    when corresponding `MediaFile` object is deleted.
+    Releases the file when corresponding `MediaFile` object is deleted,
+    the file itself is deleted after commit if no other object references it.
+    The objects deleted by collect_orphan_images have their files released in batches.
     """
-    if instance.image:
-        import os
-        if os.path.isfile(instance.image.path):
-            os.remove(instance.image.path)
+    if instance.image and not getattr(instance, '_files_released', False):
+        release_files(instance.image.storage, [instance.image.name] + variants_names(instance.variants))
 
 @receiver(models.signals.pre_save, sender=UploadedImage)
 def auto_delete_file_on_change(sender, instance, **kwargs):
     """
-    Deletes old file from filesystem
+    Remembers the old file
     when corresponding `MediaFile` object is updated
-    with new file.
+    with new file, it is released in image_file_saved.
+    The old name is tracked by from_db, so no query is needed.
     """
-    if not instance.pk:
+    old_name = instance._loaded_image_name
+    if not instance.pk or not old_name:
         return False
 
-    try:
-        old_file = UploadedImage.objects.get(pk=instance.pk).image
-    except UploadedImage.DoesNotExist:
-        return False
+    if old_name != instance.image.name:
+        instance._replaced_image_name = old_name
+        # the variants of the old file are made again for the new one
+        release_files(instance.image.storage, variants_names(instance.variants))
+        instance.width = instance.height = None
+        instance.placeholder = ''
+        instance.variants = {}
+        instance.is_processed = False
 
-    new_file = instance.image
-    if not old_file == new_file:
-        import os
-        if os.path.isfile(old_file.path):
-            os.remove(old_file.path)
+@receiver(models.signals.post_save, sender=UploadedImage)
+def image_file_saved(sender, instance, created, **kwargs):
+    """Counts the references to the files, the file name is final only after the save"""
+    replaced_name = instance._replaced_image_name
+    instance._replaced_image_name = None
+    stored_name = pop_stored_name(instance, 'image')
+    name = instance._loaded_image_name = instance.image.name
+    if created:
+        update_references(instance.image.storage, name, stored_name=stored_name)
+    elif replaced_name is not None or stored_name is not None:
+        update_references(instance.image.storage, name, replaced_name or name, stored_name)
@@ -1,12 +1,14 @@
 from rest_framework import serializers
 
+from account.serializers import PresenceListSerializer, is_online_in_context
+
 from .models import *
 
 
 class GoodCategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = GoodCategory
-        exclude = ['parent', ]
+        exclude = ['parent', 'path']
 
 
 class GoodSerializer(serializers.ModelSerializer):
@@ -14,6 +16,8 @@ class GoodSerializer(serializers.ModelSerializer):
     images_for_read = serializers.SerializerMethodField('get_images')
     is_author = serializers.SerializerMethodField('get_is_author')
     is_service = serializers.SerializerMethodField('get_is_service')
+    author_online = serializers.SerializerMethodField('get_author_online')
+    images_info = serializers.SerializerMethodField('get_images_info')
 
     def validate(self, data):
         data = super().validate(data)
@@ -25,32 +29,93 @@ class GoodSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Good
-        fields = '__all__'
+        exclude = ['search_vector']
+        list_serializer_class = PresenceListSerializer
         extra_kwargs = {
             'state': {'read_only': True},
             'user': {'read_only': True},
             'moderation_disallow_reason': {'read_only': True},
         }
 
+    # the methods below read only prefetched/selected data, see GoodQuerySet.with_related
+
     @staticmethod
     def get_images(obj):
         return map(lambda x: x.image.name, obj.images.all())
 
+    @staticmethod
+    def get_images_info(obj):
+        return UploadedImageSerializer(obj.images.all(), many=True).data
 
     def get_is_author(self, obj):
         request = self.context.get("request")
-        return request and hasattr(request, "user") and obj.user == request.user
+        return bool(request and hasattr(request, "user") and obj.user_id == request.user.pk)
 
     @staticmethod
     def get_is_service(obj):
         return obj.category.is_service if obj.category else False
 
+    @staticmethod
+    def get_user_id(obj):
+        return obj.user_id
+
+    def get_author_online(self, obj):
+        return is_online_in_context(self, obj.user_id)
+
+class GoodFeedFilterSerializer(serializers.Serializer):
+    """Query params of the goods feed"""
+    price_min = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    price_max = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    gifts_min = serializers.IntegerField(min_value=0, required=False)
+    gifts_max = serializers.IntegerField(min_value=0, required=False)
+    exchange = serializers.BooleanField(required=False, default=False)
+    condition_min = serializers.IntegerField(min_value=1, max_value=5, required=False)
+    category = serializers.PrimaryKeyRelatedField(queryset=GoodCategory.objects.all(), required=False)
+
+    def filter_queryset(self, queryset):
+        """
+        Goods with NOT_READY_FOR_SELL (-1) prices are excluded by any price bound,
+        the conditions match the partial indexes of Good
+        """
+        data = self.validated_data
+        if 'price_min' in data or 'price_max' in data:
+            queryset = queryset.filter(price_currency__gte=max(data.get('price_min', 0), 0))
+            if 'price_max' in data:
+                queryset = queryset.filter(price_currency__lte=data['price_max'])
+        if 'gifts_min' in data or 'gifts_max' in data:
+            queryset = queryset.filter(price_gifts__gte=max(data.get('gifts_min', 0), 0))
+            if 'gifts_max' in data:
+                queryset = queryset.filter(price_gifts__lte=data['gifts_max'])
+        if data['exchange']:
+            queryset = queryset.filter(ready_to_change=True)
+        if 'condition_min' in data:
+            queryset = queryset.filter(condition__gte=data['condition_min'])
+        if 'category' in data:
+            queryset = queryset.filter(category__path__startswith=data['category'].path)
+        return queryset
+
+
+class GoodModerationSerializer(serializers.Serializer):
+    MAX_GOODS = 100
+
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=MAX_GOODS)
+
+
+class GoodDisallowSerializer(GoodModerationSerializer):
+    reason = serializers.CharField()
+
+
 class UploadedImageSerializer(serializers.ModelSerializer):
     url = serializers.SerializerMethodField('get_name')
     name = serializers.SerializerMethodField('get_id')
+    variants = serializers.SerializerMethodField('get_variants')
     class Meta:
         model = UploadedImage
-        fields = ('name', 'url')
+        fields = ('name', 'url', 'width', 'height', 'placeholder', 'variants')
+
+    def get_variants(self, obj):
+        """{"320": {"jpeg": url, "webp": url}, ...}, empty until the image is processed"""
+        return obj.get_variants_urls()
 
     def get_name(self, obj):
         return obj.image.name
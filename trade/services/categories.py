@@ -0,0 +1,43 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from common.utils.trees import serialize_trees
+
+CATEGORIES_VERSION_KEY = 'categories_version'
+
+
+def _new_version():
+    # if the version key was evicted we must not come back to an old number,
+    # otherwise an outdated snapshot could be served again
+    return int(time.time() * 1000)
+
+
+def get_categories_version() -> int:
+    version = cache.get(CATEGORIES_VERSION_KEY)
+    if version is None:
+        cache.add(CATEGORIES_VERSION_KEY, _new_version(), None)
+        version = cache.get(CATEGORIES_VERSION_KEY)
+    return version
+
+
+def bump_categories_version():
+    """Invalidates all cached category snapshots. Call it after any change of the categories."""
+    try:
+        cache.incr(CATEGORIES_VERSION_KEY)
+    except ValueError:
+        cache.set(CATEGORIES_VERSION_KEY, _new_version(), None)
+
+
+def get_categories_tree() -> list:
+    """Returns the serialized categories tree, built once per categories version"""
+    from trade.models import GoodCategory
+    from trade.serializers import GoodCategorySerializer
+
+    key = f'categories_tree_{get_categories_version()}'
+    tree = cache.get(key)
+    if tree is None:
+        tree = serialize_trees(GoodCategory.objects.all(), GoodCategorySerializer)
+        cache.set(key, tree, settings.CATEGORIES_TREE_CACHE_TIMEOUT)
+    return tree
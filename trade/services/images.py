@@ -0,0 +1,72 @@
+import base64
+import io
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+PLACEHOLDER_SIZE = 16
+VARIANT_FORMATS = {
+    'jpeg': ('JPEG', 'jpg'),
+    'webp': ('WEBP', 'webp'),
+}
+
+
+def _encode(image, image_format, quality) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, quality=quality)
+    return buffer.getvalue()
+
+
+def variant_name(name, width, extension):
+    """photos/2022/01/01/a.jpg -> photos/2022/01/01/variants/a_320.webp"""
+    directory, filename = os.path.split(os.path.splitext(name)[0])
+    return f'{directory}/variants/{filename}_{width}.{extension}'
+
+
+def process_image(name, widths=None, storage=None) -> dict:
+    """
+    Makes the resized JPEG and WebP variants of the image narrower than the original
+    (one variant of the original width if it's narrower than all the widths), and a tiny placeholder.
+    The variants are saved to the storage of the image, in ContentAddressedStorage they are reference counted
+    like the images. Runs in the process pool of the process_images command, so everything it needs
+    is in the arguments and settings. Returns the fields of UploadedImage to update.
+    """
+    storage = storage or default_storage
+    widths = sorted(widths or settings.IMAGE_VARIANT_WIDTHS)
+    with storage.open(name) as file:
+        image = Image.open(file)
+        size = image.size
+        # a JPEG is decoded right at a reduced scale which is still enough for the largest variant
+        image.draft('RGB', (widths[-1], widths[-1]))
+        decoded_size = image.size
+        image = ImageOps.exif_transpose(image)
+        if image.size != decoded_size:  # rotated by the EXIF orientation
+            size = size[::-1]
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+
+    width, height = size
+    variants = {}
+    for target in [x for x in widths if x < width] or [width]:
+        resized = image.resize((target, max(1, round(image.height * target / image.width))), Image.LANCZOS)
+        variants[str(target)] = {
+            key: storage.save(variant_name(name, target, extension),
+                              ContentFile(_encode(resized, image_format, settings.IMAGE_VARIANT_QUALITY)))
+            for key, (image_format, extension) in VARIANT_FORMATS.items()
+        }
+
+    placeholder = image.copy()
+    placeholder.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+    return {
+        'width': width,
+        'height': height,
+        'placeholder': 'data:image/jpeg;base64,' + base64.b64encode(_encode(placeholder, 'JPEG', 50)).decode(),
+        'variants': variants,
+    }
+
+
+def variants_names(variants) -> list:
+    return [name for formats in variants.values() for name in formats.values()]
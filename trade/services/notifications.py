@@ -0,0 +1,97 @@
+import functools
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.template import loader
+from django.urls import reverse
+
+from common.services import telegram
+from ..models import Good, PendingModeration
+
+MODERATORS_CACHE_KEY = 'goods_moderators'
+AUTHOR_TEMPLATES = {
+    Good.PublishState.PUBLISHED: 'telegram/good_published_notify.html',
+    Good.PublishState.MODERATION_DISALLOW: 'telegram/good_moder_disallow_notify.html',
+}
+
+
+@functools.lru_cache(maxsize=None)
+def get_template(name):
+    """Templates are compiled once per process"""
+    return loader.get_template(name)
+
+
+def get_moderator_ids():
+    """Telegram ids of the goods moderators, cached, see moderators_changed"""
+    ids = cache.get(MODERATORS_CACHE_KEY)
+    if ids is None:
+        ids = list(get_user_model().objects.filter(groups__id=settings.GROUP_GOODS_MODERATOR_ID)
+                   .values_list('tg_id', flat=True))
+        cache.set(MODERATORS_CACHE_KEY, ids, settings.MODERATORS_CACHE_TIMEOUT)
+    return ids
+
+
+def invalidate_moderators():
+    cache.delete(MODERATORS_CACHE_KEY)
+
+
+def _moderation_item(good):
+    return {
+        "url": settings.SITE_DOMAIN + reverse('admin:trade_good_change', args=(good.id,)),
+        "name": f"{good.name} id{good.id} {good.category.full_name if good.category else ''}",
+    }
+
+
+def notify_goods_state(goods):
+    """
+    Queues the notifications about the current state of the goods: moderators are asked to check
+    the goods on moderation, authors get the moderation result. One insert to the outbox for all the goods.
+    In the digest mode the goods on moderation are collected for send_moderation_digest instead.
+    Authors are read from `good.user`, select them with the goods.
+    """
+    messages = []
+    on_moderation = [x for x in goods if x.state == Good.PublishState.MODERATION]
+    if on_moderation and settings.MODERATION_DIGEST_INTERVAL:
+        PendingModeration.objects.bulk_create([PendingModeration(good=x) for x in on_moderation],
+                                              ignore_conflicts=True)
+    elif on_moderation:
+        moderators = get_moderator_ids()
+        template = get_template('telegram/good_moderation_notify.html')
+        for good in on_moderation:
+            text = template.render(_moderation_item(good))
+            messages.extend((x, text) for x in moderators)
+
+    for good in goods:
+        if good.state in AUTHOR_TEMPLATES:
+            template = get_template(AUTHOR_TEMPLATES[good.state])
+            messages.append((good.user.tg_id, template.render({"url": '', "name": good.name})))
+
+    telegram.enqueue_messages(messages, parse_mode="HTML")
+
+
+@transaction.atomic
+def send_moderation_digest() -> int:
+    """
+    Queues one digest message per moderator with the collected goods which are still on moderation,
+    long lists are split by MODERATION_DIGEST_MAX_GOODS. Returns the number of the goods in the digest.
+    """
+    pending = list(
+        PendingModeration.objects.select_for_update(skip_locked=True, of=('self',))
+        .select_related('good__category').order_by('id')
+    )
+    if not pending:
+        return 0
+    PendingModeration.objects.filter(pk__in=[x.pk for x in pending]).delete()
+
+    goods = [_moderation_item(x.good) for x in pending if x.good.state == Good.PublishState.MODERATION]
+    moderators = get_moderator_ids()
+    template = get_template('telegram/good_moderation_digest.html')
+    size = settings.MODERATION_DIGEST_MAX_GOODS
+    messages = []
+    for i in range(0, len(goods), size):
+        text = template.render({"total": len(goods), "goods": goods[i:i + size]})
+        messages.extend((x, text) for x in moderators)
+    telegram.enqueue_messages(messages, parse_mode="HTML")
+    return len(goods)
@@ -1,3 +1,602 @@
-from django.test import TestCase
+import base64
+import datetime
+import io
+import re
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import AnonymousUser, Group
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image as PILImage
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase
+
+from account.models import User
+from common.models import StoredFile, TelegramOutboxMessage
+from common.utils.pagination import KeysetPagination
+from common.utils.testing import TemporaryMediaMixin
+from .admin import GoodCategoryAdmin
+from .management.commands import process_images
+from .models import Good, GoodCategory, PendingModeration, UploadedImage
+from .serializers import UploadedImageSerializer
+from .services.categories import get_categories_tree, get_categories_version
+from .services.images import process_image, variants_names
+from .services.notifications import send_moderation_digest
+from .views import (GoodsFeedViewSet, GoodsModerationViewSet, GoodsViewSet, ModerationQueuePagination,
+                    SearchRankPagination)
+
+
+class GoodsListQueriesTest(APITestCase):
+    """The number of queries of the goods lists must not depend on the number of goods"""
+    QUERY_BUDGET = 3
+
+    def setUp(self):
+        self.user = User.objects.create(tg_id='1')
+        self.category = GoodCategory.objects.create(name='Категория')
+        self.client.force_authenticate(self.user)
+
+    def create_goods(self, count):
+        for i in range(count):
+            good = Good.objects.create(name=f'Товар {i}', user=self.user, category=self.category, contacts='-')
+            UploadedImage.objects.create(image=f'photos/{good.id}_1.jpg', good=good)
+            UploadedImage.objects.create(image=f'photos/{good.id}_2.jpg', good=good)
+        Good.objects.update(state=Good.PublishState.PUBLISHED)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'page_size': 100})
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assert_fixed_queries(self, url):
+        self.create_goods(2)
+        few = self.count_queries(url)
+        self.create_goods(30)
+        many = self.count_queries(url)
+
+        self.assertEqual(few, many)
+        self.assertLessEqual(many, self.QUERY_BUDGET)
+
+    def test_own_goods(self):
+        self.assert_fixed_queries('/api/trade/good/')
+
+    def test_feed(self):
+        self.assert_fixed_queries('/api/trade/feed/')
+
+    def test_feed_anonymous(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get('/api/trade/feed/').status_code, 401)
+
+
+class GoodCategoryPathTest(TestCase):
+    def setUp(self):
+        self.root = GoodCategory.objects.create(name='Транспорт')
+        self.child = GoodCategory.objects.create(name='Велосипеды', parent=self.root)
+        self.grandchild = GoodCategory.objects.create(name='Горные', parent=self.child)
+
+    def get(self, category):
+        return GoodCategory.objects.get(pk=category.pk)
+
+    def test_create(self):
+        grandchild = self.get(self.grandchild)
+        self.assertEqual(grandchild.path, f'{self.root.pk}/{self.child.pk}/{self.grandchild.pk}/')
+        self.assertEqual(grandchild.full_name, 'Транспорт > Велосипеды > Горные')
+        self.assertEqual(grandchild.ancestor_ids, [self.root.pk, self.child.pk])
+        self.assertEqual(set(self.root.subtree()), {self.root, self.child, self.grandchild})
+
+    def test_move_subtree(self):
+        other = GoodCategory.objects.create(name='Спорт')
+        child = self.get(self.child)
+        child.parent = other
+        child.save()
+        grandchild = self.get(self.grandchild)
+        self.assertEqual(grandchild.path, f'{other.pk}/{self.child.pk}/{self.grandchild.pk}/')
+        self.assertEqual(grandchild.full_name, 'Спорт > Велосипеды > Горные')
+        self.assertEqual(set(self.get(self.root).subtree()), {self.root})
+
+    def test_move_into_own_subtree(self):
+        root = self.get(self.root)
+        root.parent = self.grandchild
+        with self.assertRaises(ValueError):
+            root.save()
+        self.assertEqual(self.get(self.root).path, f'{self.root.pk}/')
+
+    def test_rename(self):
+        child = self.get(self.child)
+        child.name = 'Велики'
+        child.save()
+        self.assertEqual(self.get(self.grandchild).full_name, 'Транспорт > Велики > Горные')
+
+    def test_delete(self):
+        self.get(self.root).delete()
+        child, grandchild = self.get(self.child), self.get(self.grandchild)
+        self.assertIsNone(child.parent_id)
+        self.assertEqual((child.path, child.full_name), (f'{self.child.pk}/', 'Велосипеды'))
+        self.assertEqual(grandchild.path, f'{self.child.pk}/{self.grandchild.pk}/')
+        self.assertEqual(grandchild.full_name, 'Велосипеды > Горные')
+
+    @skipUnless(connection.vendor == 'postgresql', "full-text search is PostgreSQL only")
+    def test_rename_updates_search(self):
+        good = Good.objects.create(name='Товар', user=User.objects.create(tg_id='1'), contacts='-',
+                                   category=self.grandchild)
+        self.assertFalse(Good.objects.matching('самокаты').exists())
+        root = self.get(self.root)
+        root.name = 'Самокаты'
+        root.save()
+        self.assertEqual(list(Good.objects.matching('самокаты')), [good])
+
+
+class CategoriesTreeCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.first = GoodCategory.objects.create(name='Транспорт', sort_order=1)
+        self.second = GoodCategory.objects.create(name='Спорт', sort_order=2)
+
+    def names(self, tree):
+        return [node['name'] for node in tree]
+
+    def test_cached(self):
+        self.assertEqual(self.names(get_categories_tree()), ['Транспорт', 'Спорт'])
+        with CaptureQueriesContext(connection) as queries:
+            get_categories_tree()
+        self.assertEqual(len(queries), 0)
+
+    def test_create(self):
+        get_categories_tree()
+        version = get_categories_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            GoodCategory.objects.create(name='Дом', sort_order=3)
+        self.assertNotEqual(get_categories_version(), version)
+        self.assertEqual(self.names(get_categories_tree()), ['Транспорт', 'Спорт', 'Дом'])
+
+    def test_rename(self):
+        get_categories_tree()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.second.name = 'Хобби'
+            self.second.save()
+        self.assertEqual(self.names(get_categories_tree()), ['Транспорт', 'Хобби'])
+
+    def test_admin_reorder(self):
+        model_admin = GoodCategoryAdmin(GoodCategory, admin.site)
+        get_categories_tree()
+        with self.captureOnCommitCallbacks(execute=True):
+            model_admin._update_order([[self.first.pk, 3]], {})
+        self.assertEqual(self.names(get_categories_tree()), ['Спорт', 'Транспорт'])
+
+        version = get_categories_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            model_admin._move_item(2, 3, {})
+        self.assertNotEqual(get_categories_version(), version)
+        self.assertEqual(self.names(get_categories_tree()), ['Транспорт', 'Спорт'])
+
+
+class WalkPagesMixin:
+    def walk(self, url, page_size=7, **params):
+        """The ids of all the pages, following the next links"""
+        ids, response = [], self.client.get(url, {'page_size': page_size, **params})
+        while True:
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), page_size)
+            ids += [x['id'] for x in response.data['results']]
+            if not response.data['next']:
+                return ids
+            response = self.client.get(response.data['next'])
+
+
+class KeysetPaginationTest(WalkPagesMixin, APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(tg_id='1')
+        other = User.objects.create(tg_id='2')
+        self.client.force_authenticate(self.user)
+        for i in range(25):
+            Good.objects.create(name=f'Товар {i}', user=self.user if i % 5 else other, contacts='-')
+        # many goods with the same updated_at, the id breaks the ties
+        Good.objects.filter(id__in=Good.objects.order_by('id').values('id')[5:20]).update(
+            updated_at=datetime.datetime(2022, 1, 1), state=Good.PublishState.PUBLISHED)
+        Good.objects.exclude(updated_at=datetime.datetime(2022, 1, 1)).update(state=Good.PublishState.PUBLISHED)
+
+    def assert_walk(self, url, queryset):
+        ids = self.walk(url)
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(ids, list(queryset.order_by('-updated_at', '-id').values_list('id', flat=True)))
+
+    def test_own_goods(self):
+        self.assert_walk('/api/trade/good/', Good.objects.filter(user=self.user))
+
+    def test_feed(self):
+        self.assert_walk('/api/trade/feed/', Good.objects.all())
+
+    def test_invalid_cursor(self):
+        for cursor in ('not base64!', 'WzFd', base64.urlsafe_b64encode(b'["date", 1]').decode()):
+            self.assertEqual(self.client.get('/api/trade/feed/', {'cursor': cursor}).status_code, 404)
+
+    def test_page_size(self):
+        pagination = KeysetPagination()
+        for page_size, expected in ((0, 1), (5, 5), (1000, pagination.max_page_size), ('x', pagination.page_size)):
+            request = Request(APIRequestFactory().get('/', {'page_size': page_size}))
+            self.assertEqual(pagination.get_page_size(request), expected, page_size)
+        response = self.client.get('/api/trade/feed/', {'page_size': 5})
+        self.assertEqual(len(response.data['results']), 5)
+
+
+class GoodsFeedFilterTest(WalkPagesMixin, APITestCase):
+    def setUp(self):
+        user = User.objects.create(tg_id='1')
+        self.client.force_authenticate(user)
+        self.root = GoodCategory.objects.create(name='Транспорт')
+        self.child = GoodCategory.objects.create(name='Велосипеды', parent=self.root)
+        self.other = GoodCategory.objects.create(name='Спорт')
+
+        def create(**kwargs):
+            return Good.objects.create(name='Товар', user=user, contacts='-', state=Good.PublishState.PUBLISHED,
+                                       **kwargs)
+
+        self.not_for_sale = create(category=self.root, condition=2)
+        self.cheap = create(price_currency=10, price_gifts=1, category=self.child, condition=4)
+        self.expensive = create(price_currency=1000, price_gifts=100, ready_to_change=True, category=self.other)
+
+    def assert_filtered(self, expected, **params):
+        self.assertEqual(set(self.walk('/api/trade/feed/', **params)), {good.pk for good in expected}, params)
+
+    def test_price(self):
+        self.assert_filtered([self.not_for_sale, self.cheap, self.expensive])
+        self.assert_filtered([self.cheap, self.expensive], price_min=0)
+        self.assert_filtered([self.cheap], price_max=100)
+        self.assert_filtered([self.expensive], price_min=100)
+        self.assert_filtered([self.cheap, self.expensive], gifts_max=1000)
+        self.assert_filtered([self.cheap], gifts_min=1, gifts_max=10)
+
+    def test_exchange(self):
+        self.assert_filtered([self.expensive], exchange='true')
+        self.assert_filtered([self.not_for_sale, self.cheap, self.expensive], exchange='false')
+
+    def test_condition(self):
+        self.assert_filtered([self.cheap, self.expensive], condition_min=4)
+        self.assert_filtered([self.expensive], condition_min=5)
+
+    def test_category_subtree(self):
+        self.assert_filtered([self.not_for_sale, self.cheap], category=self.root.pk)
+        self.assert_filtered([self.cheap], category=self.child.pk)
+        self.assert_filtered([self.expensive], category=self.other.pk)
+        self.assertEqual(self.client.get('/api/trade/feed/', {'category': 0}).status_code, 400)
+
+
+@skipUnless(connection.vendor == 'postgresql', "full-text search is PostgreSQL only")
+class GoodsSearchTest(WalkPagesMixin, APITestCase):
+    def setUp(self):
+        user = User.objects.create(tg_id='1')
+        self.client.force_authenticate(user)
+        for i in range(26):
+            # the same text gives the same rank, the id breaks the ties
+            Good.objects.create(name='Велосипед', description='Горный', user=user, contacts='-',
+                                state=Good.PublishState.PUBLISHED)
+        Good.objects.create(name='Самокат', user=user, contacts='-', state=Good.PublishState.PUBLISHED)
+
+    def test_search(self):
+        ids = self.walk('/api/trade/feed/search/', q='велосипеды')
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(ids, list(Good.objects.filter(name='Велосипед').order_by('-id').values_list('id', flat=True)))
+
+    def test_no_matches(self):
+        response = self.client.get('/api/trade/feed/search/', {'q': 'телевизор'})
+        self.assertEqual((response.data['results'], response.data['next']), ([], None))
+
+    def test_empty_query(self):
+        self.assertEqual(self.client.get('/api/trade/feed/search/', {'q': ' '}).status_code, 400)
+
+
+class GoodImagesQueriesTest(TemporaryMediaMixin, APITestCase):
+    """Detaching the images of a good and releasing their files don't run queries per image"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(tg_id='1')
+        self.client.force_authenticate(self.user)
+
+    def count_queries(self, images_count):
+        good = Good.objects.create(name='Товар', user=self.user, contacts='-')
+        for i in range(images_count):
+            UploadedImage.objects.create(image=f'content/{good.id}_{i}.jpg', good=good, uploader=self.user)
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(f'/api/trade/good/{good.id}/?action=draft',
+                                       {'name': 'Товар', 'contacts': '-', 'images': []}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(good.images.exists())
+        self.assertFalse(StoredFile.objects.filter(name__startswith=f'content/{good.id}_').exists())
+        return len(queries)
+
+    def test_detach_images(self):
+        self.assertEqual(self.count_queries(1), self.count_queries(10))
+
+
+class GoodStateNotificationsTest(TestCase):
+    """Notifications are queued only when the state of a good changes"""
+
+    def setUp(self):
+        self.user = User.objects.create(tg_id='1')
+        self.good = Good.objects.create(name='Товар', user=self.user, contacts='-')
+
+    def test_save_without_state_change(self):
+        self.good.state = Good.PublishState.PUBLISHED
+        self.good.save()
+        self.assertEqual(TelegramOutboxMessage.objects.count(), 1)
+
+        self.good.description = 'Описание'
+        self.good.save()
+        good = Good.objects.get(pk=self.good.pk)
+        good.save()
+        self.assertEqual(TelegramOutboxMessage.objects.count(), 1)
+
+    def test_search_vector_update(self):
+        good = Good.objects.get(pk=self.good.pk)
+        with CaptureQueriesContext(connection) as queries:
+            good.state = Good.PublishState.PUBLISHED
+            good.save()
+            good.contacts = '+7'
+            good.save()
+        self.assertFalse([x for x in queries if 'to_tsvector' in x['sql']])
+
+        with CaptureQueriesContext(connection) as queries:
+            good.description = 'Описание'
+            good.save()
+            good.save()
+        self.assertEqual(len([x for x in queries if 'to_tsvector' in x['sql']]), 1)
+
+    def test_transition(self):
+        goods = [Good.objects.create(name=f'Товар {i}', user=self.user, contacts='-') for i in range(5)]
+        with CaptureQueriesContext(connection) as queries:
+            moved = Good.objects.filter(pk__in=[x.pk for x in goods]).transition(Good.PublishState.PUBLISHED)
+        self.assertEqual(len(moved), 5)
+        self.assertEqual(TelegramOutboxMessage.objects.count(), 5)
+        inserts = [x for x in queries if x['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 1)
+
+        self.assertEqual(Good.objects.filter(pk__in=[x.pk for x in goods]).transition(Good.PublishState.PUBLISHED), [])
+        self.assertEqual(TelegramOutboxMessage.objects.count(), 5)
+
+    @override_settings(MODERATION_DIGEST_INTERVAL=60, MODERATION_DIGEST_MAX_GOODS=2)
+    def test_moderation_digest(self):
+        cache.clear()
+        group = Group.objects.get_or_create(pk=settings.GROUP_GOODS_MODERATOR_ID, defaults={'name': 'Модераторы'})[0]
+        for i in range(3):
+            User.objects.create(tg_id=f'moderator{i}').groups.add(group)
+        goods = [Good.objects.create(name=f'Товар {i}', user=self.user, contacts='-') for i in range(3)]
+        Good.objects.filter(pk__in=[x.pk for x in goods]).transition(Good.PublishState.MODERATION)
+        self.assertEqual(PendingModeration.objects.count(), 3)
+        self.assertFalse(TelegramOutboxMessage.objects.exists())
+
+        self.assertEqual(send_moderation_digest(), 3)
+        # 3 goods are split into 2 messages for each of 3 moderators
+        self.assertEqual(TelegramOutboxMessage.objects.count(), 6)
+        self.assertFalse(PendingModeration.objects.exists())
+        self.assertEqual(send_moderation_digest(), 0)
+
+
+class GoodsModerationTest(APITestCase):
+    def setUp(self):
+        self.moderator = User.objects.create(tg_id='1', is_staff=True)
+        self.author = User.objects.create(tg_id='2')
+        self.goods = [Good.objects.create(name=f'Товар {i}', user=self.author, contacts='-') for i in range(3)]
+        Good.objects.update(state=Good.PublishState.MODERATION)
+        self.client.force_authenticate(self.moderator)
+
+    def test_queue(self):
+        Good.objects.filter(pk=self.goods[0].pk).update(state=Good.PublishState.DRAFT)
+        response = self.client.get('/api/trade/moderation/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([x['id'] for x in response.data['results']], [x.id for x in self.goods[1:]])
+
+        self.client.force_authenticate(self.author)
+        self.assertEqual(self.client.get('/api/trade/moderation/').status_code, 403)
+
+    def test_approve(self):
+        ids = [x.id for x in self.goods]
+        response = self.client.post('/api/trade/moderation/approve/', {'ids': ids}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(response.data['ids']), ids)
+        self.assertEqual(Good.objects.filter(state=Good.PublishState.PUBLISHED).count(), 3)
+        self.assertEqual(TelegramOutboxMessage.objects.filter(receiver_id='2').count(), 3)
+
+        # goods which are not on moderation anymore are skipped
+        response = self.client.post('/api/trade/moderation/disallow/', {'ids': ids, 'reason': 'Спам'}, format='json')
+        self.assertEqual(response.data['ids'], [])
+
+    def test_disallow(self):
+        response = self.client.post('/api/trade/moderation/disallow/', {'ids': [self.goods[0].id]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post('/api/trade/moderation/disallow/',
+                                    {'ids': [self.goods[0].id], 'reason': 'Спам'}, format='json')
+        self.assertEqual(response.data['ids'], [self.goods[0].id])
+        good = Good.objects.get(pk=self.goods[0].pk)
+        self.assertEqual(good.state, Good.PublishState.MODERATION_DISALLOW)
+        self.assertEqual(good.moderation_disallow_reason, 'Спам')
+
+
+@override_settings(IMAGE_VARIANT_WIDTHS=(320, 640))
+class ImageVariantsTest(TemporaryMediaMixin, TransactionTestCase):
+    def create_image(self, size):
+        buffer = io.BytesIO()
+        PILImage.new('RGB', size, 'red').save(buffer, 'JPEG')
+        return UploadedImage.objects.create(image=SimpleUploadedFile('photo.jpg', buffer.getvalue()))
+
+    def test_process_images(self):
+        large, small = self.create_image((1000, 500)), self.create_image((200, 100))
+        call_command('process_images', once=True, workers=1, stdout=io.StringIO())
+
+        large.refresh_from_db()
+        self.assertEqual((large.width, large.height, large.is_processed), (1000, 500, True))
+        self.assertEqual(set(large.variants), {'320', '640'})
+        self.assertTrue(large.placeholder.startswith('data:image/jpeg;base64,'))
+        with large.image.storage.open(large.variants['320']['webp']) as file:
+            self.assertEqual(PILImage.open(file).size, (320, 160))
+
+        small.refresh_from_db()
+        self.assertEqual(set(small.variants), {'200'})
+        data = UploadedImageSerializer(small).data
+        self.assertEqual(set(data['variants']['200']), {'jpeg', 'webp'})
+
+        names = [large.image.name] + variants_names(large.variants)
+        large.delete()
+        self.assertFalse(any(large.image.storage.exists(x) for x in names))
+
+    def test_file_replaced_while_processing(self):
+        image, other = self.create_image((1000, 500)), self.create_image((200, 100))
+
+        def replace_and_process(*args):
+            try:
+                result = process_image(*args)
+                replaced = UploadedImage.objects.get(pk=image.pk)
+                replaced.image = other.image.name
+                replaced.save()
+                return result
+            finally:
+                connection.close()  # the worker thread's own connection
+
+        with mock.patch.object(process_images, 'process_image', side_effect=replace_and_process), \
+                ThreadPoolExecutor(max_workers=1) as executor:
+            process_images.Command().process_batch(executor, batch_size=1)
+
+        image.refresh_from_db()
+        self.assertEqual((image.image.name, image.variants, image.is_processed), (other.image.name, {}, False))
+        # the old file and the variants made for it are not referenced anymore
+        self.assertEqual(list(StoredFile.objects.values_list('name', 'references')), [(other.image.name, 2)])
+
+
+class ImageUploadTest(TemporaryMediaMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = User.objects.create(tg_id='1')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.user).key}')
+
+    def upload(self, size=(100, 50), content=None, orientation=None):
+        if content is None:
+            buffer = io.BytesIO()
+            exif = PILImage.Exif()
+            if orientation:
+                exif[0x0112] = orientation
+            PILImage.new('RGB', size, 'red').save(buffer, 'JPEG', exif=exif)
+            content = buffer.getvalue()
+        return self.client.post('/api/trade/upload', {'image': SimpleUploadedFile('photo.jpg', content)}).json()
+
+    def test_upload(self):
+        response = self.upload()
+        self.assertTrue(response['success'])
+        self.assertTrue(UploadedImage.objects.filter(pk=response['name'], uploader=self.user).exists())
+
+        self.client.credentials()
+        self.assertFalse(self.upload()['success'])
+
+    def test_size(self):
+        image = UploadedImage.objects.get(pk=self.upload(size=(100, 50))['name'])
+        self.assertEqual((image.width, image.height, image.is_processed), (100, 50, False))
+        # rotated by 90 degrees when displayed
+        image = UploadedImage.objects.get(pk=self.upload(size=(100, 50), orientation=6)['name'])
+        self.assertEqual((image.width, image.height), (50, 100))
+
+    def test_attach_foreign_image(self):
+        image_id = self.upload()['name']
+        other = User.objects.create(tg_id='2')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=other).key}')
+        response = self.client.post('/api/trade/good/?action=draft',
+                                    {'name': 'Товар', 'contacts': '-', 'images': [image_id]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertIsNone(UploadedImage.objects.get(pk=image_id).good_id)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.get(user=self.user).key}')
+        response = self.client.post('/api/trade/good/?action=draft',
+                                    {'name': 'Товар', 'contacts': '-', 'images': [image_id]}, format='json')
+        self.assertEqual(UploadedImage.objects.get(pk=image_id).good_id, response.data['id'])
+
+    @override_settings(IMAGE_UPLOAD_MAX_PIXELS=1000)
+    def test_limits(self):
+        self.assertIn('Мп', self.upload(size=(100, 50))['error'])
+        self.assertTrue(self.upload(size=(30, 30))['success'])
+        self.assertIn('изображением', self.upload(content=b'not an image')['error'])
+        with override_settings(IMAGE_UPLOAD_MAX_BYTES=100):
+            self.assertIn('МБ', self.upload(size=(30, 30))['error'])
+        self.assertEqual(UploadedImage.objects.count(), 1)
+
+
+@skipUnless(connection.vendor == 'postgresql', "query plans are checked on PostgreSQL")
+class GoodsQueryPlansTest(TestCase):
+    """The hot querysets must be served by indexes, EXPLAIN must not show sequential scans of the large tables"""
+    GOODS_COUNT = 20000
+    LARGE_TABLES = ('trade_good', 'trade_uploadedimage')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = User.objects.bulk_create([User(tg_id=str(i)) for i in range(100)])
+        cls.categories = [GoodCategory.objects.create(name=f'Категория {i}') for i in range(10)]
+        states = Good.PublishState.values
+        goods = Good.objects.bulk_create([
+            Good(name=f'Товар {i}', user=cls.users[i % len(cls.users)], contacts='-',
+                 category=cls.categories[i // len(states) % len(cls.categories)], state=states[i % len(states)],
+                 price_currency=i % 500 if i % 4 else Good.NOT_READY_FOR_SELL,
+                 price_gifts=i % 300 if i % 5 else Good.NOT_READY_FOR_SELL,
+                 ready_to_change=i % 7 == 0, condition=i % 5 + 1)
+            for i in range(cls.GOODS_COUNT)
+        ])
+        UploadedImage.objects.bulk_create([UploadedImage(image=f'photos/{x.id}.jpg', good=x) for x in goods])
+        Good.objects.filter(pk=goods[0].pk).update(name='Велосипед')
+        Good.objects.update_search_vector()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def get_queryset(self, viewset_cls, user=None, **params):
+        request = Request(APIRequestFactory().get('/', params))
+        request.user = user or AnonymousUser()
+        return viewset_cls(request=request, format_kwarg=None, action='list', kwargs={}).get_queryset()
+
+    def get_pages(self, queryset, paginator=None):
+        """The first page and a deep page, as the paginator builds them"""
+        paginator = paginator or KeysetPagination()
+        middle = queryset.order_by(*paginator.ordering)[queryset.count() // 2]
+        position = [getattr(middle, x.lstrip('-')) for x in paginator.ordering]
+        return paginator.get_page_queryset(queryset), paginator.get_page_queryset(queryset, position)
+
+    def assert_index_scans(self, name, queryset):
+        plan = queryset.explain()
+        seq_scans = re.findall(rf"Seq Scan on ({'|'.join(self.LARGE_TABLES)})\b", plan)
+        self.assertFalse(seq_scans, f"{name} scans the whole table:\n{plan}")
+
+    def test_own_goods(self):
+        for page in self.get_pages(self.get_queryset(GoodsViewSet, user=self.users[0])):
+            self.assert_index_scans('own goods', page)
+
+    def test_feed(self):
+        for page in self.get_pages(self.get_queryset(GoodsFeedViewSet)):
+            self.assert_index_scans('feed', page)
+
+    def test_feed_filters(self):
+        for params in (
+            {'price_min': 10, 'price_max': 20},
+            {'gifts_max': 5},
+            {'exchange': True},
+            {'category': self.categories[0].id},
+            {'category': self.categories[0].id, 'condition_min': 4, 'price_max': 100},
+        ):
+            for page in self.get_pages(self.get_queryset(GoodsFeedViewSet, **params)):
+                self.assert_index_scans(f'feed {params}', page)
+
+    def test_moderation_queue(self):
+        queryset = self.get_queryset(GoodsModerationViewSet)
+        for page in self.get_pages(queryset, ModerationQueuePagination()):
+            self.assert_index_scans('moderation queue', page)
+
+    def test_search(self):
+        queryset = self.get_queryset(GoodsFeedViewSet).search('велосипед')
+        self.assert_index_scans('search', SearchRankPagination().get_page_queryset(queryset))
+
+    def test_images_prefetch(self):
+        goods_ids = list(self.get_queryset(GoodsFeedViewSet).order_by('-updated_at')[:20].values_list('id', flat=True))
+        self.assert_index_scans('images', UploadedImage.objects.filter(good_id__in=goods_ids).order_by('id'))
@@ -6,6 +6,8 @@ from .views import *
 
 api_router = DefaultRouter()
 api_router.register(r'good', GoodsViewSet, 'good')
+api_router.register(r'feed', GoodsFeedViewSet, 'feed')
+api_router.register(r'moderation', GoodsModerationViewSet, 'moderation')
 
 urlpatterns = [
     path("categories", CategoriesAPIView.as_view()),
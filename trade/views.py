@@ -1,3 +1,4 @@
+from django.db import transaction
 from django.forms import ModelForm
 from django.http import Http404, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
@@ -7,22 +8,20 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
 
-from common.utils.trees import serialize_tree
+from account.authentication import get_token_key, resolve_token_user
+from account.views import IsModerator
+from common.utils.pagination import KeysetPagination
+from common.utils.uploads import ImageUploadHandler
 from .models import *
 from .serializers import *
+from .services.categories import get_categories_tree
 
 
 class CategoriesAPIView(APIView):
     permission_classes = (IsAuthenticated,)
 
     def get(self, request):
-        all_nodes = GoodCategory.objects.all()
-        level1 = list(filter(lambda x: not x.parent, all_nodes))
-        trees = []
-        for root in level1:
-            trees.append(serialize_tree(root, all_nodes, GoodCategorySerializer))
-
-        return Response(trees)
+        return Response(get_categories_tree())
 
 
 class GoodsViewSet(mixins.ListModelMixin,
@@ -34,29 +33,34 @@ class GoodsViewSet(mixins.ListModelMixin,
 
     serializer_class = GoodSerializer
     permission_classes = (IsAuthenticated,)
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
-        return Good.objects.filter(user=self.request.user).order_by('-updated_at')
+        return Good.objects.filter(user=self.request.user).with_related().order_by('-updated_at', '-id')
 
     def retrieve(self, request, *args, **kwargs):
         try:
-            good = Good.objects.filter(user=self.request.user).get(pk=kwargs['pk'])
+            good = Good.objects.with_related().filter(user=self.request.user).get(pk=kwargs['pk'])
         except Good.DoesNotExist:
             try:
-                good = Good.objects.filter(state=Good.PublishState.PUBLISHED).get(pk=kwargs['pk'])
+                good = Good.objects.with_related().filter(state=Good.PublishState.PUBLISHED).get(pk=kwargs['pk'])
             except Good.DoesNotExist:
                 raise Http404
 
         serializer = self.serializer_class(good, context={'request': request})
         return Response(serializer.data)
 
+    @transaction.atomic
     def perform_update(self, serializer):
         action = self.request.query_params.get('action', '').lower()
         if action not in ('publish', 'draft', 'delete', 'sold'):
             raise serializers.ValidationError({"action": "should be publish/draft/delete/sold"})
-        old_state = self.get_object().state
+        # UpdateModelMixin.update() has already loaded the good (with its images, see get_queryset),
+        # it is reused for all the checks below instead of calling get_object() again
+        good = serializer.instance
+        old_state = good.state
 
-        img_changes = self._update_images(serializer)
+        img_changes = self._update_images(serializer, good)
         if action == 'draft':
             return serializer.save(state=Good.PublishState.DRAFT)
 
@@ -68,13 +72,14 @@ class GoodsViewSet(mixins.ListModelMixin,
 
         # else: action=='publish'
         if settings.MODERATION_AFTER_CHANGES:
-            if old_state == Good.PublishState.PUBLISHED and not self._find_diffs(serializer) and not img_changes:
+            if old_state == Good.PublishState.PUBLISHED and not self._find_diffs(serializer, good) and not img_changes:
                 return serializer.save(state=Good.PublishState.PUBLISHED)
             # all the other cases: from Draft to Publish or from Publish with changes to Publish
             return serializer.save(state=Good.PublishState.MODERATION)
         else:
             serializer.save(state=Good.PublishState.PUBLISHED)
 
+    @transaction.atomic
     def perform_create(self, serializer):
         action = self.request.query_params.get('action', '').lower()
         if action not in ('publish', 'draft'):
@@ -94,40 +99,98 @@ class GoodsViewSet(mixins.ListModelMixin,
         else:
             images_ids = []
         new_obj = serializer.save(user=self.request.user, state=state)
-        self._set_good_for_new_images(new_obj.id, images_ids)
+        self._set_good_for_new_images(new_obj, images_ids)
         return new_obj
 
-    def _update_images(self, serializer):
+    def _update_images(self, serializer, good):
         if 'images' not in serializer.validated_data:
             return False
-        old_images = list(self.get_object().images.all())
+        old_images = list(good.images.all())
         new_images = serializer.validated_data['images']
         del serializer.validated_data['images']
-        changes = set(new_images) != set(map(lambda x: x.id, old_images))
+        old_ids = set(map(lambda x: x.id, old_images))
+        changes = set(new_images) != old_ids
         if not changes:
             return False
 
-        id = self.get_object().id
-        for image in old_images:
-            if image.id not in new_images:
-                image.delete()
-        self._set_good_for_new_images(id, new_images)
+        removed_ids = old_ids - set(new_images)
+        if removed_ids:
+            # the files are deleted in one batch after commit, see auto_delete_file_on_delete
+            UploadedImage.objects.filter(good=good, pk__in=removed_ids).delete()
+        self._set_good_for_new_images(good, set(new_images) - old_ids)
         return True
 
+    def _set_good_for_new_images(self, good, images_ids):
+        """Attaches the images with one UPDATE. Only the images uploaded by the user are taken"""
+        if not images_ids:
+            return
+        UploadedImage.objects.filter(uploader=self.request.user, pk__in=images_ids).update(good=good)
 
-    def _set_good_for_new_images(self, good_id, images_ids):
-        for i in images_ids:
-            image = UploadedImage.objects.get(pk=i)
-            image.good = Good.objects.get(pk=good_id)
-            image.save()
-
-    def _find_diffs(self, serializer):
+    @staticmethod
+    def _find_diffs(serializer, good):
         for key, value in serializer.validated_data.items():
-            if getattr(self.get_object(), key) != value:
+            if getattr(good, key) != value:
                 return True
         return False
 
 
+class SearchRankPagination(KeysetPagination):
+    ordering = ('-rank', '-id')
+
+
+class GoodsFeedViewSet(mixins.ListModelMixin, GenericViewSet):
+    """Published goods of all the users, the recently updated go first"""
+    serializer_class = GoodSerializer
+    permission_classes = (IsAuthenticated,)
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        queryset = Good.objects.filter(state=Good.PublishState.PUBLISHED).with_related()
+        filters = GoodFeedFilterSerializer(data=self.request.query_params)
+        filters.is_valid(raise_exception=True)
+        return filters.filter_queryset(queryset)
+
+    @decorators.action(detail=False)
+    def search(self, request):
+        """Full-text search by name, category and description, the most relevant go first"""
+        text = request.query_params.get('q', '').strip()
+        if not text:
+            raise serializers.ValidationError({"q": "should not be empty"})
+
+        paginator = SearchRankPagination()
+        page = paginator.paginate_queryset(self.get_queryset().search(text), request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+
+class ModerationQueuePagination(KeysetPagination):
+    ordering = ('updated_at', 'id')
+
+
+class GoodsModerationViewSet(mixins.ListModelMixin, GenericViewSet):
+    """Goods on moderation, the longest waiting go first. Goods are approved and disallowed in bulk"""
+    serializer_class = GoodSerializer
+    permission_classes = (IsModerator,)
+    pagination_class = ModerationQueuePagination
+
+    def get_queryset(self):
+        return Good.objects.filter(state=Good.PublishState.MODERATION).with_related()
+
+    @decorators.action(detail=False, methods=['post'])
+    def approve(self, request):
+        serializer = GoodModerationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        goods = Good.objects.filter(pk__in=serializer.validated_data['ids']).approve()
+        return Response({"ids": [x.id for x in goods]})
+
+    @decorators.action(detail=False, methods=['post'])
+    def disallow(self, request):
+        serializer = GoodDisallowSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        goods = Good.objects.filter(pk__in=serializer.validated_data['ids']).disallow(serializer.validated_data['reason'])
+        return Response({"ids": [x.id for x in goods]})
+
+
 class GoodImages(APIView):
     permission_classes = []
     def get(self, request, good_id):
@@ -138,19 +201,38 @@ class GoodImages(APIView):
         })
 
 
+class ImageForm(ModelForm):
+    class Meta:
+        model = UploadedImage
+        fields = ('image',)
+
+    def save(self, commit=True):
+        # the size is known from the header read by ImageUploadHandler, process_images confirms it later
+        size = getattr(self.cleaned_data['image'], 'image_size', None)
+        if size:
+            self.instance.width, self.instance.height = size
+        return super().save(commit)
+
+
 @csrf_exempt
 def upload_image_view(request):
-    class ImageForm(ModelForm):
-        class Meta:
-            model = UploadedImage
-            fields = ('image',)
+    key = get_token_key(request)
+    user = resolve_token_user(request, key) if key else None
+    if user is None or not user.is_active:
+        return JsonResponse({'success': False, 'error': "Необходима авторизация"}, status=401)
+
+    # must be set before request.FILES is read
+    upload_handler = ImageUploadHandler(request)
+    request.upload_handlers = [upload_handler]
 
     if request.FILES:
-        form = ImageForm(request.POST, request.FILES)
+        form = ImageForm(request.POST, request.FILES, instance=UploadedImage(uploader=user))
         if form.is_valid():
             inst = form.save()
             return JsonResponse({'success': True, 'name': inst.id})
 
+    if upload_handler.error:
+        return JsonResponse({'success': False, 'error': upload_handler.error})
     return JsonResponse({'success': False})
 
 class GoodForm(ModelForm):